@@ -0,0 +1,104 @@
+from argparse import ArgumentParser
+
+import numpy as np
+import moderngl
+
+from expression_parser.functions import FUNCS
+from expression_parser.evaluator import SHADER_FUNCS, shader_pow
+from headless import create_standalone_context
+from shader_builder import assemble, finish
+
+# Measures the error of the complex functions of fragment_shader/complex.glsl against Python's cmath
+# with the branch cuts of the shader (evaluator.SHADER_FUNCS), with the exact and the fast (FAST_MATH) implementations,
+# on a whole grid of the complex plane.
+
+ACCURACY_FILES = ["header.glsl", "complex.glsl", "accuracy.glsl"]
+
+# exponents checked for c_pow (z^w), integers use a faster path with FAST_MATH
+POWERS = [2, 3, 7, -2, 0.5, 1 + 1j]
+
+
+def grid(extent: float, resolution: int) -> np.ndarray:
+    # resolution x resolution points in [-extent, extent]^2, shifted by half a step to avoid the axes and 0
+    step = 2 * extent / resolution
+    values = -extent + step * (np.arange(resolution) + 0.5)
+    x, y = np.meshgrid(values, values)
+    return (x + 1j * y).astype(np.complex64).ravel()
+
+def reference(name: str, points: np.ndarray, power: complex | None = None) -> np.ndarray:
+    # values at the float32 points computed in double precision, on the same branches as the shader (nan where cmath raises)
+    def value(z: complex) -> complex:
+        try:
+            if power is not None:
+                return shader_pow(z, complex(power))
+            return complex(SHADER_FUNCS[name](z))
+        except (ZeroDivisionError, ValueError, OverflowError):
+            return complex(np.nan, np.nan)
+    return np.array([value(complex(z)) for z in points])
+
+def error(values: np.ndarray, expected: np.ndarray) -> np.ndarray:
+    # absolute error for small values, relative error for large ones
+    return np.abs(values - expected) / np.maximum(np.abs(expected), 1)
+
+
+class Evaluator:
+    # Evaluates GLSL expressions of z on points with a compute shader
+
+    def __init__(self, ctx: moderngl.Context, points: np.ndarray) -> None:
+        self.ctx = ctx
+        self.count = len(points)
+        self.inputs = ctx.buffer(points.astype(np.complex64).tobytes())
+        self.outputs = ctx.buffer(reserve=self.inputs.size)
+
+    def evaluate(self, glsl: str, fast_math: bool) -> np.ndarray:
+        code = assemble(ACCURACY_FILES).replace("FUNCTION", glsl)
+        shader = self.ctx.compute_shader(finish(code, {"FAST_MATH": int(fast_math)}))
+        self.inputs.bind_to_storage_buffer(0)
+        self.outputs.bind_to_storage_buffer(1)
+        shader.run(-(-self.count // 64))
+        shader.release()
+        return np.frombuffer(self.outputs.read(), dtype=np.complex64).astype(complex)
+
+    def release(self):
+        self.inputs.release()
+        self.outputs.release()
+
+
+def measure(evaluator: Evaluator, points: np.ndarray, name: str, glsl: str, power: complex | None = None) -> tuple[float, float, int]:
+    # max error of the exact and fast implementations, and the number of points skipped (no finite reference value)
+    expected = reference(name, points, power)
+    exact = error(evaluator.evaluate(glsl, False), expected)
+    fast = error(evaluator.evaluate(glsl, True), expected)
+    counted = np.isfinite(expected)
+    return np.max(exact[counted]), np.max(fast[counted]), np.count_nonzero(~counted)
+
+def report(extent: float, resolution: int, backend: str | None = None) -> list[tuple[str, float, float, int]]:
+    ctx = create_standalone_context(backend)
+    points = grid(extent, resolution)
+    evaluator = Evaluator(ctx, points)
+
+    rows = [(name, *measure(evaluator, points, name, f"c_{name}(z)")) for name in sorted(FUNCS)]
+    rows += [
+        (f"z^{power}", *measure(evaluator, points, "pow", f"c_pow(z, complex({complex(power).real:.1f}, {complex(power).imag:.1f}))", power))
+        for power in POWERS
+    ]
+
+    evaluator.release()
+    ctx.release()
+    return rows
+
+
+def main():
+    arg_parser = ArgumentParser(description="Measure the error of the complex functions of the shaders against cmath (with the branch cuts of the shaders).")
+    arg_parser.add_argument("--extent", type=float, default=4, help="points are taken in [-extent, extent] for both parts")
+    arg_parser.add_argument("--resolution", type=int, default=512, help="number of points along each axis")
+    arg_parser.add_argument("--backend", default=None, help="moderngl context backend (e.g. egl)")
+    args = arg_parser.parse_args()
+
+    print(f"{"function":<10} {"exact":>10} {"fast":>10} {"skipped":>8}")
+    for name, exact, fast, skipped in report(args.extent, args.resolution, args.backend):
+        print(f"{name:<10} {exact:>10.2e} {fast:>10.2e} {skipped:>8}")
+
+
+if __name__ == '__main__':
+    main()
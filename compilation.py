@@ -0,0 +1,169 @@
+from collections import OrderedDict
+from functools import wraps
+
+import moderngl
+
+from expression_parser.lexer import Lexer
+from expression_parser.flat import FlatExpression, parse_flat, to_tree, simplify_flat, glsl_flat, flat_custom_functions, flat_variables, numpy_flat
+from expression_parser.main import simplify_tree
+from expression_parser.nodes import Node
+from expression_parser.codegen import glsl_function, glsl_definitions, glsl_definition
+from expression_parser.bytecode import Bytecode, compile_bytecode
+from expression_parser.dependencies import uses_time
+from expression_parser.hoisting import hoist
+from expression_parser.numpy_backend import compile_numpy
+from shader_builder import BytecodeBuffer, ProgramCache, fragment_code, interpreter_code
+from timings import Timings
+
+# Compilation of an expression, shared by the LaTeX preview, the render window and the headless renderer:
+# text -> tokens -> flat expression -> tree -> simplified tree -> hoisted tree -> GLSL or bytecode -> program,
+# tree -> LaTeX and simplified tree -> NumPy function (CPU renderer). Every stage runs at most once per text and its duration is recorded.
+# Huge expressions skip the trees (whose passes are recursive) and are simplified and compiled to GLSL or NumPy as flat expressions,
+# without hoisting, LaTeX preview or bytecode.
+
+COMPILATION_CACHE_SIZE = 32     # texts kept, each keystroke in the expression field is a new text
+TREE_MAX_SIZE = 5000            # nodes
+TREE_MAX_DEPTH = 200            # nested nodes, far enough from the recursion limit
+
+
+def stage(method):
+    # Artifact computed on first access, timed and kept with the compilation,
+    # exceptions are kept too and raised again on each access.
+    name = method.__name__
+
+    @wraps(method)
+    def get(self: "Compilation"):
+        if name not in self.artifacts:
+            with self.timings.phase(name):
+                try:
+                    self.artifacts[name] = (method(self), None)
+                except Exception as e:
+                    self.artifacts[name] = (None, e)
+        value, error = self.artifacts[name]
+        if error is not None:
+            raise error
+        return value
+
+    return property(get)
+
+
+class Compilation:
+
+    def __init__(self, text: str) -> None:
+        self.text = text
+        self.artifacts: dict[str, tuple[object, Exception | None]] = {}
+        self.sources: dict[tuple, str] = {}     # fragment shader sources by engine and defines
+        self.timings = Timings("Compilation stage")
+
+    @stage
+    def tokens(self) -> list:
+        return list(Lexer(self.text).generate_tokens())
+
+    @stage
+    def flat(self) -> FlatExpression | None:
+        # None for an empty expression
+        return parse_flat(self.tokens)
+
+    @stage
+    def huge(self) -> bool:
+        return self.flat is not None and (len(self.flat) > TREE_MAX_SIZE or self.flat.depth() > TREE_MAX_DEPTH)
+
+    @stage
+    def tree(self) -> Node | None:
+        # None for an empty expression
+        if self.flat is None:
+            return None
+        if self.huge:
+            raise Exception("Expression too large to be handled as a tree")
+        return to_tree(self.flat)
+
+    @stage
+    def latex(self) -> str:
+        if self.tree is None:
+            raise Exception("Empty expression")
+        return f"${self.tree.tex()}$"
+
+    @stage
+    def simplified(self) -> Node:
+        if self.tree is None:
+            raise Exception("Empty expression")
+        return simplify_tree(self.tree)
+
+    @stage
+    def simplified_flat(self) -> FlatExpression:
+        # for huge expressions
+        if self.flat is None:
+            raise Exception("Empty expression")
+        return simplify_flat(self.flat)
+
+    @stage
+    def uses_time(self) -> bool:
+        if self.huge:
+            return "t" in flat_variables(self.simplified_flat)
+        return uses_time(self.simplified)
+
+    @stage
+    def hoisted(self) -> tuple[Node | None, list[Node]]:
+        # tree without the subexpressions not depending on z, and these subexpressions
+        if self.huge:
+            return None, []
+        return hoist(self.simplified)
+
+    @stage
+    def glsl(self) -> str:
+        if self.huge:
+            return glsl_flat(self.simplified_flat)
+        return glsl_function(self.hoisted[0])
+
+    @stage
+    def definitions(self) -> str:
+        if self.huge:
+            return "".join(glsl_definition(function) for function in flat_custom_functions(self.simplified_flat))
+        return glsl_definitions(self.hoisted[0])
+
+    @stage
+    def bytecode(self) -> Bytecode:
+        if self.huge:
+            raise Exception("Expression too large for the bytecode engine, use the specialized GLSL engine")
+        return compile_bytecode(self.hoisted[0])
+
+    @stage
+    def numpy(self):
+        # f evaluated on arrays of points, for the CPU renderer
+        if self.huge:
+            return numpy_flat(self.simplified_flat)
+        return compile_numpy(self.simplified, shader_branches=True)
+
+    def source(self, engine: str, defines: dict[str, int]) -> str:
+        key = (engine, *defines.items())
+        if key not in self.sources:
+            with self.timings.phase(f"source ({engine})"):
+                if engine == "bytecode":
+                    self.sources[key] = interpreter_code(**defines)
+                else:
+                    self.sources[key] = fragment_code(self.glsl, self.definitions, defines)
+        return self.sources[key]
+
+    def program(
+        self, engine: str, defines: dict[str, int], programs: ProgramCache, bytecode_buffer: BytecodeBuffer
+    ) -> tuple[moderngl.Program, moderngl.VertexArray]:
+        # Program rendering the expression with the given engine and shader defines,
+        # raises an Exception if the expression is invalid or can not be compiled
+        source = self.source(engine, defines)
+        if engine == "bytecode":
+            bytecode_buffer.write(self.bytecode)
+        with self.timings.phase("program"):
+            return programs.get(source)
+
+
+compilations: OrderedDict[str, Compilation] = OrderedDict()
+
+def compile_expression(text: str) -> Compilation:
+    # the compilation of the text, reused as long as the text is in the cache
+    if text in compilations:
+        compilations.move_to_end(text)
+    else:
+        compilations[text] = Compilation(text)
+        while len(compilations) > COMPILATION_CACHE_SIZE:
+            compilations.popitem(last=False)
+    return compilations[text]
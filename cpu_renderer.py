@@ -0,0 +1,251 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Sequence
+
+import numpy as np
+
+from shader_builder import shader_defines
+
+# CPU counterpart of fragment_shader/shader.glsl, used when OpenGL 4.5 is not available.
+# f is evaluated with expression_parser.numpy_backend and its values are colored like in the shader,
+# the image is split in bands of rows rendered by a thread pool (NumPy releases the GIL in array operations).
+# okHSL is always computed exactly, the precomputed table (colormap 2) only exists on the GPU.
+
+BAND_ROWS = 16  # rows per task, small enough to balance the threads and keep the arrays in cache
+
+# okHSL, see fragment_shader/colormap.glsl (matrices are written in the same order)
+OKLAB_TO_LMS = np.array([
+    [1, +0.3963377774, +0.2158037573],
+    [1, -0.1055613458, -0.0638541728],
+    [1, -0.0894841775, -1.2914855480],
+])
+LMS_TO_LINEAR_SRGB = np.array([
+    [+4.0767416621, -3.3077115913, +0.2309699292],
+    [-1.2684380046, +2.6097574011, -0.3413193965],
+    [-0.0041960863, -0.7034186147, +1.7076147010],
+])
+# compute_max_saturation: k0, KS and W of the red, green and blue components
+MAX_SATURATION_K0 = np.array([+1.19086277, +0.73956515, +1.35733652])
+MAX_SATURATION_KS = np.array([
+    [+1.76576728, +0.59662641, +0.75515197, +0.56771245],
+    [-0.45954404, +0.08285427, +0.12541070, +0.14503204],
+    [-0.00915799, -1.15130210, -0.50559606, +0.00692167],
+])
+MAX_SATURATION_W = LMS_TO_LINEAR_SRGB
+TOE_K1, TOE_K2 = 0.206, 0.03
+TOE_K3 = (1 + TOE_K1) / (1 + TOE_K2)
+
+
+def stepper(x: np.ndarray) -> np.ndarray:
+    return 4*x**3 - 6*x**2 + 3*x
+
+def mod(x: np.ndarray, y: float) -> np.ndarray:
+    # GLSL's mod, faster than np.mod
+    return x - y * np.floor(x / y)
+
+def true_phase(z: np.ndarray) -> np.ndarray:
+    # in [0, 2pi], like c_arg
+    p = np.angle(z)
+    return np.where(p < 0, p + 2*np.pi, p)
+
+def clamp(x: np.ndarray, low: float, high: float) -> np.ndarray:
+    # nan gives low, like GLSL's clamp on most GPUs
+    return np.fmin(np.fmax(x, low), high)
+
+def enhance(w: np.ndarray, lines: int, K: Sequence[float]) -> np.ndarray:
+    # product of the enhanced lightness of each enabled part of w
+    mult = np.ones(w.shape)
+    if lines & 1:
+        mult *= stepper(stepper(mod(w.real, K[0]) / K[0]))
+    if lines & 2:
+        mult *= stepper(stepper(mod(w.imag, K[1]) / K[1]))
+    if lines & 4:
+        logr = np.log(np.abs(w)) * K[2]
+        mult *= np.ceil(logr) - logr
+    if lines & 8:
+        mult *= stepper(stepper(mod(true_phase(w), np.pi / K[3])))
+    return mult
+
+
+# COLORMAPS =========================================================================================================
+# Colors are planar, one array per channel (faster than interleaved channels with NumPy).
+
+def hsl_to_rgb(h: np.ndarray, s: np.ndarray, l: np.ndarray) -> np.ndarray:
+    # same values as the 6 sectors of hsl_to_rgba, without branches
+    c = s * (1 - np.abs(2*l - 1))
+    h1 = mod(h * 6, 6)
+    m = l - c/2
+    return np.stack((
+        np.clip(np.abs(h1 - 3) - 1, 0, 1) * c + m,
+        np.clip(2 - np.abs(h1 - 2), 0, 1) * c + m,
+        np.clip(2 - np.abs(h1 - 4), 0, 1) * c + m,
+    ))
+
+def transform(matrix: np.ndarray, v: Sequence[np.ndarray]) -> list[np.ndarray]:
+    # matrix times the vector of arrays v
+    return [row[0] * v[0] + row[1] * v[1] + row[2] * v[2] for row in matrix]
+
+def oklab_to_linear_srgb(L: np.ndarray, a: np.ndarray, b: np.ndarray) -> list[np.ndarray]:
+    return transform(LMS_TO_LINEAR_SRGB, [x * x * x for x in transform(OKLAB_TO_LMS, (L, a, b))])
+
+def compute_max_saturation(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # maximum saturation fitting in sRGB for the hue (a, b) normalized, selected by the first component going below 0
+    red = -1.88170328*a - 0.80936493*b > 1
+    green = 1.81444104*a - 1.19445276*b > 1
+
+    def select(values: np.ndarray) -> np.ndarray:
+        return np.where(red, values[0], np.where(green, values[1], values[2]))
+
+    KS = [select(values) for values in MAX_SATURATION_KS.T]
+    S = select(MAX_SATURATION_K0) + KS[0]*a + KS[1]*b + KS[2]*a*a + KS[3]*a*b
+
+    # one step of Halley's method, as written in the shader
+    f, f1, f2 = 0, 0, 0
+    for W, (ka, kb) in zip(MAX_SATURATION_W.T, OKLAB_TO_LMS[:, 1:]):
+        W = select(W)
+        k = ka*a + kb*b
+        lms = 1 + S * k
+        lms = lms * lms * lms
+        f = f + W * lms
+        f1 = f1 + W * 3 * k * lms * lms
+        f2 = f2 + W * 6 * k * k * lms
+    return S - f * f1 / (f1 * f1 - 0.5 * f * f2)
+
+def find_cusp(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    S_cusp = compute_max_saturation(a, b)
+    r, g, b = oklab_to_linear_srgb(1, S_cusp * a, S_cusp * b)
+    L_cusp = np.cbrt(1 / np.maximum(np.maximum(r, g), b))
+    return L_cusp, L_cusp * S_cusp
+
+def find_gamut_intersection(L1: np.ndarray, C1: float, L0: np.ndarray, L_cusp: np.ndarray, C_cusp: np.ndarray) -> np.ndarray:
+    lower = (L1 - L0) * C_cusp - (L_cusp - L0) * C1 <= 0
+    return np.where(
+        lower,
+        C_cusp * L0 / (C1 * L_cusp + C_cusp * (L0 - L1)),
+        C_cusp * (L0 - 1) / (C1 * (L_cusp - 1) + C_cusp * (L0 - L1)),
+    )
+
+def toe_inv(x: np.ndarray) -> np.ndarray:
+    return (x * x + TOE_K1 * x) / (TOE_K3 * (x + TOE_K2))
+
+def get_ST_mid(a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    S = 0.11516993 + 1 / (
+        +7.44778970 + 4.15901240 * b
+        + a * (-2.19557347 + 1.75198401 * b
+            + a * (-2.13704948 - 10.02301043 * b
+                + a * (-4.24894561 + 5.38770819 * b + 4.69891013 * a)))
+    )
+    T = 0.11239642 + 1 / (
+        +1.61320320 - 0.68124379 * b
+        + a * (+0.40370612 + 0.90148123 * b
+            + a * (-0.27087943 + 0.61223990 * b
+                + a * (+0.00299215 - 0.45399568 * b - 0.14661872 * a)))
+    )
+    return S, T
+
+def get_Cs(L: np.ndarray, a: np.ndarray, b: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    L_cusp, C_cusp = find_cusp(a, b)
+    C_max = find_gamut_intersection(L, 1, L, L_cusp, C_cusp)
+
+    # scale factor compensating for the curved part of the gamut, and soft minimum of the triangle
+    k = C_max / np.minimum(L * C_cusp / L_cusp, (1 - L) * C_cusp / (1 - L_cusp))
+    S_mid, T_mid = get_ST_mid(a, b)
+    C_mid = 0.9 * k * ((L * S_mid)**-4 + ((1 - L) * T_mid)**-4)**-0.25
+
+    # the shape of C_0 does not depend on the hue
+    C_0 = ((L * 0.4)**-2 + ((1 - L) * 0.8)**-2)**-0.5
+    return C_0, C_mid, C_max
+
+def srgb_transfer_function(x: np.ndarray) -> np.ndarray:
+    return np.where(x <= 0.0031308, 12.92 * x, 1.055 * np.abs(x)**(1 / 2.4) - 0.055)
+
+def okhsl_to_rgb(h: np.ndarray, s: np.ndarray, l: np.ndarray) -> np.ndarray:
+    L = toe_inv(l)
+    a, b = np.cos(2 * np.pi * h), np.sin(2 * np.pi * h)
+    C_0, C_mid, C_max = get_Cs(L, a, b)
+
+    mid, mid_inv = 0.8, 1.25
+    # below and above mid saturation
+    t_low = mid_inv * s
+    k_1_low = mid * C_0
+    C_low = t_low * k_1_low / (1 - (1 - k_1_low / C_mid) * t_low)
+    t_high = (s - mid) / (1 - mid)
+    k_1_high = (1 - mid) * C_mid * C_mid * mid_inv * mid_inv / C_0
+    C_high = C_mid + t_high * k_1_high / (1 - (1 - k_1_high / (C_max - C_mid)) * t_high)
+    C = np.where(s < mid, C_low, C_high)
+
+    rgb = srgb_transfer_function(np.stack(oklab_to_linear_srgb(L, C * a, C * b)))
+    # white and black are exact
+    rgb[:, l == 1] = 1
+    rgb[:, l == 0] = 0
+    return rgb
+
+COLORMAPS = {0: hsl_to_rgb, 1: okhsl_to_rgb, 2: okhsl_to_rgb}
+
+
+# RENDERING =========================================================================================================
+
+def color(w: np.ndarray, pxl_x: np.ndarray, pxl_y: np.ndarray, defines: dict[str, int], K: Sequence[float]) -> np.ndarray:
+    # (4, ...) RGBA planes of the colors of the values w of f, in [0, 1],
+    # pxl are the pixel coordinates used by the nan checkerboard
+    infinite = np.isinf(w.real) & np.isinf(w.imag)
+    invalid = np.isnan(w.real) | np.isnan(w.imag)
+    # invalid values are replaced, their color is set at the end
+    w = np.where(infinite | invalid, 1, w)
+
+    h, s, l = np.zeros(w.shape), np.zeros(w.shape), np.ones(w.shape)
+    if defines["ARG_HUE"]:
+        h, s, l = 0.5 * true_phase(w) / np.pi, np.full(w.shape, 0.8), np.full(w.shape, 0.5)
+    if defines["MOD_LUM"]:
+        rho = np.abs(w)
+        l = clamp(rho / (rho + 1), 0, 0.999999)
+    if defines["STYLE_LINES"]:
+        l = 0.6 * l + 0.4 * enhance(w, defines["STYLE_LINES"], K)
+
+    rgba = np.empty((4,) + w.shape)
+    rgba[:3] = COLORMAPS[defines["COLORMAP"]](h, s, l)
+    rgba[3] = 1
+
+    rgba[:, infinite] = 1
+    checker = mod(np.floor(pxl_x / 10) + np.floor(pxl_y / 10), 2)
+    rgba[:, invalid] = 0.4 + 0.2 * np.broadcast_to(checker, w.shape)[invalid]
+    return rgba
+
+
+class CpuRenderer:
+    # Renders f into an RGBA buffer, band by band in a thread pool
+
+    def __init__(self, threads: int | None = None) -> None:
+        self.executor = ThreadPoolExecutor(threads or os.cpu_count())
+
+    def render(
+        self, function: Callable[..., np.ndarray], pixels: np.ndarray,
+        origin: tuple[float, float], scale: float, style: int, K: Sequence[float],
+        t: float, parameters: Sequence[complex], offset: tuple[float, float] = (0, 0), pixel_size: float = 1
+    ):
+        # Renders the area of the view of the size of pixels, a (height, width, 4) uint8 RGBA array written in place (top row first).
+        # function is the numpy_backend compilation of f, offset is the center of the area in pixels from the center of the view,
+        # pixel_size is the size of the pixels of the array in pixels of the view (above 1 for previews, below for supersampling).
+        height, width, _ = pixels.shape
+        defines = shader_defines(style)
+        K = tuple(K)
+        t = complex(int(t * 1000) % 4294967296 / 1000)  # same precision as the shader's uniform
+        # pixel centers, relative to the center of the view and y going up
+        pxl_x = (np.arange(width) + 0.5 - width / 2) * pixel_size + offset[0]
+
+        @np.errstate(all="ignore")
+        def render_band(top: int):
+            # invalid values give nan or inf like in the shader
+            rows = np.arange(top, min(top + BAND_ROWS, height))
+            pxl_y = ((height / 2 - rows - 0.5) * pixel_size + offset[1])[:, None]
+            z = (pxl_x / scale + origin[0]) + 1j * (pxl_y / scale + origin[1])
+            rgba = color(function(z, t, parameters), pxl_x, pxl_y, defines, K)
+            # conversion to 8 bits like OpenGL's, nan gives 0
+            np.rint(clamp(rgba, 0, 1) * 255, out=rgba)
+            pixels[rows[0]:rows[-1] + 1] = np.moveaxis(rgba, 0, -1)
+
+        # list() raises the exceptions of the threads
+        list(self.executor.map(render_band, range(0, height, BAND_ROWS)))
+
+    def release(self):
+        self.executor.shutdown()
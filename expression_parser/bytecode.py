@@ -0,0 +1,143 @@
+from array import array
+from dataclasses import dataclass, field
+
+from expression_parser.nodes import *
+from expression_parser.functions import FUNCS
+from expression_parser.codegen import CSEGraph, inline_functions
+from expression_parser.main import literal_value
+
+# Compilation of trees to the bytecode of the stack machine in fragment_shader/interpreter.glsl.
+# An instruction is an opcode in its 8 lower bits and an argument in the others (constant, parameter, hoisted value or register index).
+# Shared subtrees are computed once and kept in registers.
+
+# Sizes of the buffer and of the interpreter's arrays, defined in the shader by interpreter_definitions
+CODE_SIZE = 1024        # instructions, multiple of 4 (packed in ivec4)
+CONSTANT_COUNT = 256    # complex numbers, multiple of 2 (packed in vec4)
+STACK_SIZE = 16
+REGISTER_COUNT = 16
+
+OPCODES: list[str] = [
+    "z", "t", "const", "param", "hoisted", "load", "store",
+    "add", "sub", "mult", "div", "pow",
+    "neg", "scale", "shift",
+] + list(FUNCS)
+OP = {name: code for code, name in enumerate(OPCODES)}
+
+OPERATIONS = {
+    AddNode: "add", SubtractNode: "sub", MultiplyNode: "mult", DivideNode: "div", PowerNode: "pow"
+}
+
+
+@dataclass
+class Bytecode:
+    code: list[int] = field(default_factory=list)
+    constants: list[complex] = field(default_factory=list)
+
+    def code_bytes(self) -> bytes:
+        # std140 block header (code length in an ivec4) followed by the instructions
+        return array('i', [len(self.code), 0, 0, 0] + self.code).tobytes()
+
+    def constant_bytes(self) -> bytes:
+        return array('f', [
+            part for value in self.constants for part in (value.real, value.imag)
+        ]).tobytes()
+
+
+class BytecodeCompiler:
+
+    def __init__(self, tree: Node) -> None:
+        # the interpreter has no function calls
+        self.graph = CSEGraph(inline_functions(tree))
+        self.bytecode = Bytecode()
+        self.constant_ids: dict[complex, int] = {}
+        self.registers: dict[int, int] = {}     # subtree number -> register
+        self.loads_left: dict[int, int] = {}    # subtree number -> number of loads before the register is free
+        self.free_registers = list(range(REGISTER_COUNT - 1, -1, -1))
+        self.depth = 0
+
+    def compile(self) -> Bytecode:
+        self.visit(self.graph.root)
+        if len(self.bytecode.code) > CODE_SIZE:
+            raise Exception(f"Expression too long for the bytecode engine ({len(self.bytecode.code)} > {CODE_SIZE} instructions)")
+        return self.bytecode
+
+    def emit(self, opcode: str, argument: int = 0, push: int = 0):
+        self.bytecode.code.append(OP[opcode] | argument << 8)
+        self.depth += push
+        if self.depth > STACK_SIZE:
+            raise Exception(f"Expression too deep for the bytecode engine (more than {STACK_SIZE} pending values)")
+
+    def constant(self, value: complex) -> int:
+        if value not in self.constant_ids:
+            if len(self.bytecode.constants) == CONSTANT_COUNT:
+                raise Exception(f"Too many constants for the bytecode engine (more than {CONSTANT_COUNT})")
+            self.constant_ids[value] = len(self.bytecode.constants)
+            self.bytecode.constants.append(value)
+        return self.constant_ids[value]
+
+    def visit(self, i: int):
+        # emits the code pushing the value of subtree i on the stack
+        if i in self.registers:
+            self.emit("load", self.registers[i], push=1)
+            self.loads_left[i] -= 1
+            if self.loads_left[i] == 0:
+                self.free_registers.append(self.registers.pop(i))
+            return
+
+        node = self.graph.nodes[i]
+        children = self.graph.children[i]
+
+        if isinstance(node, VariableNode):
+            if node.value not in ("z", "t"):
+                raise Exception(f"Unknown variable {node.value}")
+            self.emit(node.value, push=1)
+        elif isinstance(node, ParameterNode):
+            self.emit("param", node.value.index, push=1)
+        elif isinstance(node, HoistedNode):
+            self.emit("hoisted", node.index, push=1)
+        elif isinstance(node, LiteralNode):
+            self.emit("const", self.constant(literal_value(node)), push=1)
+        elif isinstance(node, OperationNode):
+            self.visit(children["node_a"])
+            self.visit(children["node_b"])
+            self.emit(OPERATIONS[node.__class__], push=-1)
+        elif isinstance(node, FunctionNode):
+            self.visit(children["node"])
+            self.emit(node.name)
+        elif isinstance(node, NegateNode):
+            self.visit(children["node"])
+            self.emit("neg")
+        elif isinstance(node, ScaleNode):
+            self.visit(children["node"])
+            self.emit("scale", self.constant(complex(node.factor)))
+        elif isinstance(node, ShiftNode):
+            self.visit(children["node"])
+            self.emit("shift", self.constant(complex(node.shift)))
+        else:
+            raise Exception(f"{node.__class__.__name__} is not supported by the bytecode engine")
+
+        # leaves are cheaper to push again than to load
+        if self.graph.uses[i] > 1 and children:
+            if not self.free_registers:
+                raise Exception(f"Too many shared subexpressions for the bytecode engine (more than {REGISTER_COUNT})")
+            self.registers[i] = self.free_registers.pop()
+            self.loads_left[i] = self.graph.uses[i] - 1
+            self.emit("store", self.registers[i])
+
+
+def compile_bytecode(tree: Node) -> Bytecode:
+    # raises an Exception if the tree does not fit in the interpreter's buffers
+    return BytecodeCompiler(tree).compile()
+
+def interpreter_definitions() -> tuple[str, str]:
+    # sizes and opcodes definitions, and the cases of the functions, for the interpreter shader
+    sizes = {"CODE_SIZE": CODE_SIZE, "CONSTANT_COUNT": CONSTANT_COUNT, "STACK_SIZE": STACK_SIZE, "REGISTER_COUNT": REGISTER_COUNT}
+    defines = "\n".join(
+        [f"#define {name} {value}" for name, value in sizes.items()] +
+        [f"#define OP_{name.upper()} {code}" for name, code in OP.items()]
+    )
+    cases = "\n            ".join(
+        f"case OP_{name.upper()}: stack[top] = c_{name}(stack[top]); break;"
+        for name in FUNCS
+    )
+    return defines, cases
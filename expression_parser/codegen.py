@@ -0,0 +1,163 @@
+from expression_parser.nodes import *
+from expression_parser.functions import CustomFunction
+from expression_parser.main import simplify_tree
+
+# GLSL code generation with common subexpression elimination:
+# structurally identical subtrees are computed once and stored in local variables.
+
+
+def expand(node: Node) -> Node:
+    # variables like x or θ are functions of z
+    while isinstance(node, VariableNode) and not isinstance(node.value, str):
+        node = node.value.subtree
+    return node
+
+def is_leaf(node: Node) -> bool:
+    return isinstance(node, (LiteralNode, VariableNode, ParameterNode, HoistedNode))
+
+def with_children(node: Node, children: dict[str, Node]) -> Node:
+    return node.__class__(**{
+        key: children.get(key, value)
+        for key, value in node.fields().items()
+    })
+
+
+class CSEGraph:
+    # Subtrees numbered in post-order, identical subtrees sharing the same number
+
+    def __init__(self, tree: Node) -> None:
+        self.ids: dict[tuple, int] = {}
+        self.nodes: list[Node] = []
+        self.children: list[dict[str, int]] = []
+        self.uses: list[int] = []
+        self.visited: dict[int, int] = {}   # id(node) -> number, for subtrees shared in the tree
+        self.root = self.visit(tree)
+        self.uses[self.root] += 1
+
+    def visit(self, node: Node) -> int:
+        if id(node) in self.visited:
+            return self.visited[id(node)]
+        node_id = id(node)
+
+        node = expand(node)
+        if is_leaf(node):
+            children = {}
+            key = ("leaf", node.glsl())
+        else:
+            children = {
+                name: self.visit(value)
+                for name, value in node.fields().items()
+                if isinstance(value, Node)
+            }
+            key = (node.__class__.__name__,) + tuple(
+                children.get(name, value)
+                for name, value in node.fields().items()
+            )
+
+        if key not in self.ids:
+            self.ids[key] = len(self.nodes)
+            self.nodes.append(node)
+            self.children.append(children)
+            self.uses.append(0)
+            for child in children.values():
+                self.uses[child] += 1
+
+        self.visited[node_id] = self.ids[key]
+        return self.ids[key]
+
+
+def glsl_function(tree: Node, indent: str = "    ") -> str:
+    # Body of a GLSL function of z returning the value of the tree
+    graph = CSEGraph(tree)
+
+    lines = []
+    code: list[str] = []
+    # post-order numbering: children always come before their parents
+    for i, node in enumerate(graph.nodes):
+        if is_leaf(node):
+            code.append(node.glsl())
+            continue
+
+        expression = with_children(node, {
+            name: VariableNode(code[child])
+            for name, child in graph.children[i].items()
+        }).glsl()
+
+        if graph.uses[i] > 1:
+            name = f"v{len(lines)}"
+            lines.append(f"complex {name} = {expression};")
+            code.append(name)
+        else:
+            code.append(expression)
+
+    lines.append(f"return {code[graph.root]};")
+    return f"\n{indent}".join(lines)
+
+
+# CUSTOM FUNCTIONS ==================================================================================================
+
+def function_body(function: CustomFunction) -> Node:
+    # simplified once per function
+    if function.simplified is None:
+        function.simplified = simplify_tree(function.func)
+    return function.simplified
+
+def glsl_definition(function: CustomFunction, indent: str = "    ") -> str:
+    # generated once per function
+    if function.glsl is None:
+        function.glsl = (
+            f"complex u_{function.name}(complex z) {{\n"
+            f"{indent}{glsl_function(function_body(function), indent)}\n"
+            "}\n"
+        )
+    return function.glsl
+
+def custom_functions(tree: Node, found: dict[str, CustomFunction] | None = None, visited: set[int] | None = None) -> list[CustomFunction]:
+    # custom functions called in the tree, a function coming after the ones it calls
+    if found is None:
+        found, visited = {}, set()
+    if id(tree) in visited:
+        return list(found.values())
+    visited.add(id(tree))
+
+    tree = expand(tree)
+    for value in tree.fields().values():
+        if isinstance(value, Node):
+            custom_functions(value, found, visited)
+    if isinstance(tree, CustomFunctionNode) and tree.value.name not in found:
+        custom_functions(function_body(tree.value), found, visited)
+        found[tree.value.name] = tree.value
+    return list(found.values())
+
+def glsl_definitions(tree: Node) -> str:
+    # GLSL functions of the custom functions called in the tree, to place before f
+    return "".join(glsl_definition(function) for function in custom_functions(tree))
+
+def inline_functions(tree: Node, argument: Node | None = None, memo: dict[int, Node] | None = None) -> Node:
+    # Replaces calls to custom functions with their body, for backends without function calls.
+    # z is replaced by argument (when inlining a body), which is shared instead of copied so that the size stays linear.
+    if memo is None:
+        memo = {}
+    if id(tree) in memo:
+        return memo[id(tree)]
+
+    if isinstance(tree, VariableNode):
+        if isinstance(tree.value, str):
+            result = argument if tree.value == "z" and argument is not None else tree
+        elif argument is not None:
+            # variables like x or θ are functions of z
+            result = inline_functions(tree.value.subtree, argument, memo)
+        else:
+            result = tree
+    elif isinstance(tree, CustomFunctionNode):
+        # the body has its own z, its nodes are not shared with the caller
+        result = inline_functions(function_body(tree.value), inline_functions(tree.node, argument, memo), {})
+    else:
+        result = with_children(tree, {
+            name: inline_functions(value, argument, memo)
+            for name, value in tree.fields().items()
+            if isinstance(value, Node)
+        })
+
+    memo[id(tree)] = result
+    return result
@@ -0,0 +1,37 @@
+from expression_parser.nodes import *
+
+# Analysis of which base variables (z and t) and parameters a tree depends on
+
+
+def variables_of(tree: Node, memo: dict[int, frozenset[str]] | None = None) -> frozenset[str]:
+    # names of the base variables and parameters used in the tree, variables like x or θ count as z
+    if memo is None:
+        memo = {}
+    if id(tree) in memo:
+        return memo[id(tree)]
+
+    if isinstance(tree, VariableNode):
+        if isinstance(tree.value, str):
+            result = frozenset((tree.value,))
+        else:
+            result = variables_of(tree.value.subtree, memo)
+    elif isinstance(tree, ParameterNode):
+        result = frozenset((tree.value.name,))
+    elif isinstance(tree, CustomFunctionNode):
+        # z in the body is the argument
+        body = variables_of(tree.value.func, memo)
+        result = body - {"z"}
+        if "z" in body:
+            result |= variables_of(tree.node, memo)
+    else:
+        result = frozenset().union(*(
+            variables_of(value, memo)
+            for value in tree.fields().values()
+            if isinstance(value, Node)
+        ))
+
+    memo[id(tree)] = result
+    return result
+
+def uses_time(tree: Node) -> bool:
+    return "t" in variables_of(tree)
@@ -0,0 +1,133 @@
+import cmath
+import math
+import operator
+from typing import Callable, Sequence
+from weakref import WeakKeyDictionary
+
+from expression_parser.nodes import *
+from expression_parser.functions import FUNCS, true_phase
+from expression_parser.parameters import PARAMS
+
+# Evaluation of a tree at a single point with Python's complex numbers and the cmath functions of FUNCS,
+# or the functions of the shader for the values computed on the CPU for it (hoisted subtrees).
+# A tree is compiled once into nested closures (one per node, no eval), compiled nodes are cached
+# and nodes are interned, so identical subtrees and trees compiled again reuse the same closures.
+
+# closure computing the value of a node from z, t and the values of the parameters
+Point = Callable[[complex, complex, Sequence[complex]], complex]
+
+OPERATORS = {
+    AddNode: operator.add, SubtractNode: operator.sub, MultiplyNode: operator.mul,
+    DivideNode: operator.truediv, PowerNode: operator.pow,
+}
+
+
+# Same functions with the branch cuts of fragment_shader/complex.glsl, where the argument is in [0, 2pi[
+# (scalar counterparts of numpy_backend.SHADER_FUNCS, log(0) raises like in cmath).
+
+def shader_log(z: complex) -> complex:
+    return complex(math.log(abs(z)), true_phase(z))
+
+def shader_sqrt(z: complex) -> complex:
+    return cmath.rect(math.sqrt(abs(z)), true_phase(z) / 2)
+
+def shader_pow(z1: complex, z2: complex) -> complex:
+    r1, t1 = abs(z1), true_phase(z1)
+    return cmath.rect(r1 ** z2.real * math.exp(-z2.imag * t1), z2.imag * math.log(r1) + t1 * z2.real)
+
+def shader_asin(z: complex) -> complex:
+    return -1j * shader_log(1j * z + shader_sqrt(1 - z * z))
+
+def shader_acos(z: complex) -> complex:
+    return -1j * shader_log(z + shader_sqrt(z * z - 1))
+
+def shader_atan(z: complex) -> complex:
+    return 0.5j * shader_log((1 - 1j * z) / (1 + 1j * z))
+
+def shader_asinh(z: complex) -> complex:
+    return shader_log(z + shader_sqrt(z * z + 1))
+
+def shader_acosh(z: complex) -> complex:
+    return shader_log(z + shader_sqrt(z * z - 1))
+
+def shader_atanh(z: complex) -> complex:
+    return 0.5 * shader_log((1 + z) / (1 - z))
+
+SHADER_FUNCS: dict[str, Callable[[complex], complex]] = FUNCS | {
+    "log": shader_log,
+    "log10": lambda z: shader_log(z) / math.log(10),
+    "sqrt": shader_sqrt,
+    "asin": shader_asin,
+    "acos": shader_acos,
+    "atan": shader_atan,
+    "asinh": shader_asinh,
+    "acosh": shader_acosh,
+    "atanh": shader_atanh,
+}
+SHADER_OPERATORS = OPERATORS | {PowerNode: shader_pow}
+
+# closures do not reference their node, entries are removed with the nodes (one cache per set of branches)
+COMPILED: "dict[bool, WeakKeyDictionary[Node, Point]]" = {False: WeakKeyDictionary(), True: WeakKeyDictionary()}
+
+
+def compile_node(tree: Node, shader_branches: bool = False) -> Point:
+    compiled = COMPILED[shader_branches]
+    if tree not in compiled:
+        compiled[tree] = closure(tree, shader_branches)
+    return compiled[tree]
+
+def closure(tree: Node, shader_branches: bool) -> Point:
+    if isinstance(tree, NumberNode):
+        value = complex(tree.value)
+        return lambda z, t, params: value
+    if isinstance(tree, ConstantNode):
+        value = complex(tree.value.eval_)
+        return lambda z, t, params: value
+    if isinstance(tree, ParameterNode):
+        index = tree.value.index
+        return lambda z, t, params: params[index]
+    if isinstance(tree, VariableNode):
+        if tree.value == "z":
+            return lambda z, t, params: z
+        if tree.value == "t":
+            return lambda z, t, params: t
+        if isinstance(tree.value, str):
+            raise Exception(f"Unknown variable {tree.value}")
+        return compile_node(tree.value.subtree, shader_branches)
+    if isinstance(tree, HoistedNode):
+        return compile_node(tree.node, shader_branches)
+
+    if isinstance(tree, CustomFunctionNode):
+        # z in the body is the argument
+        body, argument = compile_node(tree.value.func, shader_branches), compile_node(tree.node, shader_branches)
+        return lambda z, t, params: body(argument(z, t, params), t, params)
+    if isinstance(tree, OperationNode):
+        operators = SHADER_OPERATORS if shader_branches else OPERATORS
+        function, a, b = operators[tree.__class__], compile_node(tree.node_a, shader_branches), compile_node(tree.node_b, shader_branches)
+        return lambda z, t, params: function(a(z, t, params), b(z, t, params))
+    if isinstance(tree, FunctionNode):
+        function, node = (SHADER_FUNCS if shader_branches else FUNCS)[tree.name], compile_node(tree.node, shader_branches)
+        return lambda z, t, params: function(node(z, t, params))
+    if isinstance(tree, NegateNode):
+        node = compile_node(tree.node, shader_branches)
+        return lambda z, t, params: -node(z, t, params)
+    if isinstance(tree, ScaleNode):
+        factor, node = tree.factor, compile_node(tree.node, shader_branches)
+        return lambda z, t, params: node(z, t, params) * factor
+    if isinstance(tree, ShiftNode):
+        shift, node = tree.shift, compile_node(tree.node, shader_branches)
+        return lambda z, t, params: node(z, t, params) + shift
+
+    raise Exception(f"Can not evaluate {tree.__class__.__name__}")
+
+
+def compile_point(tree: Node, shader_branches: bool = False) -> Callable[..., complex]:
+    # Compiles a tree into f(z, t, params) evaluating it at one point, t and the parameters are 0 by default.
+    # Invalid operations raise ZeroDivisionError, ValueError or OverflowError (the shader gives nan or inf instead).
+    # With shader_branches, multivalued functions take the same values as in the shader.
+    func = compile_node(tree, shader_branches)
+
+    def f(z: complex = 0, t: complex = 0, params: Sequence[complex] = (0j,) * len(PARAMS)) -> complex:
+        return complex(func(complex(z), complex(t), params))
+
+    return f
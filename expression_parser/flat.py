@@ -0,0 +1,424 @@
+from array import array
+from enum import IntEnum
+
+from expression_parser.tokens import Token, TokenType
+from expression_parser.nodes import *
+from expression_parser.constants import Constant
+from expression_parser.variables import Variable
+from expression_parser.parameters import Parameter
+from expression_parser.functions import FUNCS, DEF_FUNCS, CustomFunction
+from expression_parser.main import simplify_node
+from expression_parser.codegen import custom_functions, function_body
+from expression_parser.dependencies import variables_of
+from expression_parser.numpy_backend import SHADER_FUNCS, SHADER_NAMESPACE, as_complex, compile_numpy, shader_pow, vectorized
+
+# Array-backed representation of expressions, for huge machine-generated ones (Taylor expansions, generated rationals...).
+# Nodes are stored in arrays, children always before their parents, and identical nodes are stored once.
+# Every pass is a loop over the arrays: there is no recursion limit and parsing to GLSL takes linear time.
+
+
+class Op(IntEnum):
+    # leaves, the payload is their value
+    NUMBER = 0
+    CONSTANT = 1
+    VARIABLE = 2
+    PARAMETER = 3
+    # one child (a), the payload is the function, factor or shift
+    FUNCTION = 4
+    CUSTOM = 5
+    NEGATE = 6
+    SCALE = 7
+    SHIFT = 8
+    # two children (a, b)
+    ADD = 9
+    SUB = 10
+    MULT = 11
+    DIV = 12
+    POW = 13
+
+LEAVES = {Op.NUMBER, Op.CONSTANT, Op.VARIABLE, Op.PARAMETER}
+OPERATIONS = {Op.ADD: AddNode, Op.SUB: SubtractNode, Op.MULT: MultiplyNode, Op.DIV: DivideNode, Op.POW: PowerNode}
+NODE_OPS = {node_class: op for op, node_class in OPERATIONS.items()} | {
+    NumberNode: Op.NUMBER, ConstantNode: Op.CONSTANT, VariableNode: Op.VARIABLE, ParameterNode: Op.PARAMETER,
+    FunctionNode: Op.FUNCTION, CustomFunctionNode: Op.CUSTOM, NegateNode: Op.NEGATE, ScaleNode: Op.SCALE, ShiftNode: Op.SHIFT,
+}
+
+GLSL = {
+    Op.FUNCTION: lambda a, payload: f"c_{payload}({a})",
+    Op.CUSTOM: lambda a, payload: f"u_{payload.name}({a})",
+    Op.NEGATE: lambda a, payload: f"c_neg({a})",
+    Op.SCALE: lambda a, payload: f"c_scale({a}, {float(payload)!r})",
+    Op.SHIFT: lambda a, payload: f"c_shift({a}, {float(payload)!r})",
+    Op.ADD: lambda a, b: f"c_add({a}, {b})",
+    Op.SUB: lambda a, b: f"c_sub({a}, {b})",
+    Op.MULT: lambda a, b: f"c_mult({a}, {b})",
+    Op.DIV: lambda a, b: f"c_div({a}, {b})",
+    Op.POW: lambda a, b: f"c_pow({a}, {b})",
+}
+
+# with the branch cuts of the shader, like the CPU renderer
+NUMPY = {
+    Op.FUNCTION: lambda a, payload: SHADER_FUNCS[payload](a),
+    Op.NEGATE: lambda a, payload: -a,
+    Op.SCALE: lambda a, payload: a * float(payload),
+    Op.SHIFT: lambda a, payload: a + float(payload),
+    Op.ADD: lambda a, b: a + b,
+    Op.SUB: lambda a, b: a - b,
+    Op.MULT: lambda a, b: a * b,
+    Op.DIV: lambda a, b: a / b,
+    Op.POW: shader_pow,
+}
+
+
+class FlatNode:
+    # view of a node of a FlatExpression
+
+    __slots__ = ("expression", "index")
+
+    def __init__(self, expression: "FlatExpression", index: int) -> None:
+        self.expression = expression
+        self.index = index
+
+    @property
+    def op(self) -> Op:
+        return Op(self.expression.ops[self.index])
+
+    @property
+    def payload(self):
+        return self.expression.payloads[self.index]
+
+    @property
+    def children(self) -> tuple["FlatNode", ...]:
+        expression, i = self.expression, self.index
+        return tuple(FlatNode(expression, child) for child in (expression.a[i], expression.b[i]) if child >= 0)
+
+    def __repr__(self) -> str:
+        return f"{self.op.name}({", ".join(map(repr, self.children)) or repr(self.payload)})"
+
+
+class FlatExpression:
+
+    __slots__ = ("ops", "a", "b", "payloads", "ids", "root")
+
+    def __init__(self) -> None:
+        self.ops = array('b')
+        self.a = array('i')     # first child, -1 for leaves
+        self.b = array('i')     # second child, -1 for leaves and unary nodes
+        self.payloads: list = []
+        self.ids: dict[tuple, int] = {}     # identical nodes are added once
+        self.root = -1
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def __getitem__(self, i: int) -> FlatNode:
+        return FlatNode(self, i)
+
+    def add(self, op: Op, a: int = -1, b: int = -1, payload=None) -> int:
+        # index of the node, added if it was not already there
+        key = (op, a, b, payload_key(payload))
+        if key not in self.ids:
+            self.ids[key] = len(self.ops)
+            self.ops.append(op)
+            self.a.append(a)
+            self.b.append(b)
+            self.payloads.append(payload)
+        return self.ids[key]
+
+    def reachable(self) -> list[int]:
+        # indices of the nodes used by the root (arguments after the first one of functions are not), in order
+        used = bytearray(len(self))
+        used[self.root] = 1
+        for i in range(self.root, -1, -1):
+            if used[i]:
+                for child in (self.a[i], self.b[i]):
+                    if child >= 0:
+                        used[child] = 1
+        return [i for i in range(self.root + 1) if used[i]]
+
+    def depth(self) -> int:
+        depths = array('i', bytes(4 * len(self)))
+        for i in self.reachable():
+            depths[i] = 1 + max(depths[self.a[i]] if self.a[i] >= 0 else 0, depths[self.b[i]] if self.b[i] >= 0 else 0)
+        return depths[self.root]
+
+def payload_key(payload):
+    # Constants, variables and parameters are not hashable, they are unique by name,
+    # floats are compared like interned nodes (0.0 and -0.0 are different)
+    if isinstance(payload, (Constant, Variable, Parameter)):
+        return payload.name
+    return value_key(payload)
+
+
+# PARSING ===========================================================================================================
+
+# binary operators: precedence, all left associative like in the recursive parser
+PRECEDENCES = {TokenType.PLUS: 1, TokenType.MINUS: 1, TokenType.MULTIPLY: 2, TokenType.DIVIDE: 2, TokenType.POWER: 3}
+BINARY_OPS = {TokenType.PLUS: Op.ADD, TokenType.MINUS: Op.SUB, TokenType.MULTIPLY: Op.MULT, TokenType.DIVIDE: Op.DIV, TokenType.POWER: Op.POW}
+UNARY = 4   # precedence of the signs, they apply to the next factor only (-z^2 is (-z)^2)
+LEAF_OPS = {TokenType.NUMBER: Op.NUMBER, TokenType.CONST: Op.CONSTANT, TokenType.VAR: Op.VARIABLE, TokenType.PARAM: Op.PARAMETER}
+
+
+class FlatParser:
+    # Shunting-yard parser building the same expressions as parser_.Parser, without recursion
+
+    def __init__(self, tokens) -> None:
+        self.tokens = tokens
+        self.expression = FlatExpression()
+        self.values: list[int] = []     # indices of the parsed operands
+        self.operators: list = []       # pending operators: (precedence, token), or an open parenthesis frame
+
+    def raise_error(self):
+        raise Exception("Invalid syntax")
+
+    def apply(self, precedence: int, token: Token):
+        if precedence == UNARY:
+            if token.type == TokenType.MINUS:
+                self.values.append(self.expression.add(Op.NEGATE, self.values.pop()))
+            return
+        b = self.values.pop()
+        a = self.values.pop()
+        self.values.append(self.expression.add(BINARY_OPS[token.type], a, b))
+
+    def reduce(self, precedence: int = 0):
+        # applies the pending operators down to the last open parenthesis, or above the given precedence
+        while self.operators and isinstance(self.operators[-1], tuple) and self.operators[-1][0] >= precedence:
+            self.apply(*self.operators.pop())
+
+    def parse(self) -> FlatExpression | None:
+        expect_operand = True
+        after_comma = False
+        function: Token = None      # function token waiting for its parenthesis
+
+        for token in self.tokens:
+            if function is not None and token.type != TokenType.LPAREN:
+                self.raise_error()
+
+            if expect_operand:
+                if token.type in LEAF_OPS:
+                    self.values.append(self.expression.add(LEAF_OPS[token.type], payload=token.value))
+                    expect_operand = False
+                elif token.type in (TokenType.PLUS, TokenType.MINUS):
+                    self.operators.append((UNARY, token))
+                elif token.type == TokenType.FUNC:
+                    function = token
+                elif token.type == TokenType.LPAREN:
+                    # frame: [function token or None, number of values before the parenthesis]
+                    self.operators.append([function, len(self.values)])
+                    function = None
+                elif token.type == TokenType.RPAREN and after_comma:
+                    # f(z,) is valid
+                    self.close()
+                    expect_operand = False
+                else:
+                    self.raise_error()
+                after_comma = False
+                continue
+
+            if token.type in PRECEDENCES:
+                self.reduce(PRECEDENCES[token.type])
+                self.operators.append((PRECEDENCES[token.type], token))
+                expect_operand = True
+            elif token.type == TokenType.COMA:
+                self.reduce()
+                if not self.operators or self.operators[-1][0] is None:
+                    self.raise_error()  # only in the parentheses of functions
+                expect_operand = after_comma = True
+            elif token.type == TokenType.RPAREN:
+                self.reduce()
+                self.close()
+            else:
+                self.raise_error()
+
+        if function is not None or expect_operand and (self.values or self.operators):
+            self.raise_error()
+        self.reduce()
+        if self.operators:
+            self.raise_error()  # parenthesis not closed
+        if not self.values:
+            return None
+
+        self.expression.root = self.values.pop()
+        return self.expression
+
+    def close(self):
+        # closes the last parenthesis
+        if not self.operators:
+            self.raise_error()
+        function, start = self.operators.pop()
+        if function is None:
+            if len(self.values) != start + 1:
+                self.raise_error()
+            return
+
+        arguments = self.values[start:]
+        del self.values[start:]
+        if not arguments:
+            self.raise_error()
+        # only the first argument is used for now
+        if function.value in FUNCS:
+            self.values.append(self.expression.add(Op.FUNCTION, arguments[0], payload=function.value))
+        else:
+            self.values.append(self.expression.add(Op.CUSTOM, arguments[0], payload=DEF_FUNCS[function.value]))
+
+
+def parse_flat(tokens) -> FlatExpression | None:
+    # None for an empty expression, raises an Exception if the syntax is invalid
+    return FlatParser(tokens).parse()
+
+
+# CONVERSIONS =======================================================================================================
+
+def build_node(op: Op, payload, children: list[Node]) -> Node:
+    if op in OPERATIONS:
+        return OPERATIONS[op](*children)
+    match op:
+        case Op.NUMBER:
+            return NumberNode(payload)
+        case Op.CONSTANT:
+            return ConstantNode(payload)
+        case Op.VARIABLE:
+            return VariableNode(payload)
+        case Op.PARAMETER:
+            return ParameterNode(payload)
+        case Op.FUNCTION:
+            return FunctionNode(payload, children[0])
+        case Op.CUSTOM:
+            return CustomFunctionNode(payload, children[0])
+        case Op.NEGATE:
+            return NegateNode(children[0])
+        case Op.SCALE:
+            return ScaleNode(children[0], payload)
+        case Op.SHIFT:
+            return ShiftNode(children[0], payload)
+
+def to_tree(expression: FlatExpression) -> Node:
+    # identical subtrees are the same node
+    nodes: dict[int, Node] = {}
+    for i in expression.reachable():
+        children = [nodes[child] for child in (expression.a[i], expression.b[i]) if child >= 0]
+        nodes[i] = build_node(Op(expression.ops[i]), expression.payloads[i], children)
+    return nodes[expression.root]
+
+def from_tree(tree: Node) -> FlatExpression:
+    expression = FlatExpression()
+    indices: dict[int, int] = {}    # id(node) -> index
+    stack = [tree]
+    while stack:
+        node = stack[-1]
+        if id(node) in indices:
+            stack.pop()
+            continue
+        children = [value for value in node.fields().values() if isinstance(value, Node)]
+        missing = [child for child in children if id(child) not in indices]
+        if missing:
+            stack.extend(missing)
+            continue
+        stack.pop()
+
+        op = NODE_OPS[node.__class__]
+        child_indices = [indices[id(child)] for child in children] + [-1, -1]
+        payload = {Op.FUNCTION: "name", Op.SCALE: "factor", Op.SHIFT: "shift"}.get(op, "value")
+        indices[id(node)] = expression.add(op, *child_indices[:2], payload=getattr(node, payload, None))
+
+    expression.root = indices[id(tree)]
+    return expression
+
+
+# PASSES ============================================================================================================
+
+def simplify_flat(expression: FlatExpression) -> FlatExpression:
+    # Same simplifications as simplify_tree, node by node from the leaves
+    nodes: dict[int, Node] = {}
+    for i in expression.reachable():
+        children = [nodes[child] for child in (expression.a[i], expression.b[i]) if child >= 0]
+        nodes[i] = simplify_node(build_node(Op(expression.ops[i]), expression.payloads[i], children))
+    return from_tree(nodes[expression.root])
+
+def glsl_flat(expression: FlatExpression, indent: str = "    ") -> str:
+    # Body of a GLSL function of z, one local variable per operation (nested calls could be too deep for GLSL compilers)
+    lines = []
+    code: dict[int, str] = {}
+    for i in expression.reachable():
+        op = Op(expression.ops[i])
+        payload = expression.payloads[i]
+        if op in LEAVES:
+            code[i] = build_node(op, payload, []).glsl()
+            continue
+
+        if op in OPERATIONS:
+            line = GLSL[op](code[expression.a[i]], code[expression.b[i]])
+        else:
+            line = GLSL[op](code[expression.a[i]], payload)
+        code[i] = f"v{len(lines)}"
+        lines.append(f"complex {code[i]} = {line};")
+
+    lines.append(f"return {code[expression.root]};")
+    return f"\n{indent}".join(lines)
+
+def numpy_flat(expression: FlatExpression):
+    # Function evaluating the expression on arrays of points for the CPU renderer, like compile_numpy(tree, shader_branches=True).
+    # The nodes are evaluated one by one from the leaves, and the array of a node is dropped after its last use.
+    steps = []
+    last_use: dict[int, int] = {}   # node -> index of the last node using it
+    for i in expression.reachable():
+        op = Op(expression.ops[i])
+        payload = expression.payloads[i]
+        children = [child for child in (expression.a[i], expression.b[i]) if child >= 0]
+        for child in children:
+            last_use[child] = i
+        if op in LEAVES:
+            step = eval(f"lambda z, t, params: {build_node(op, payload, []).numpy()}", SHADER_NAMESPACE)
+        elif op == Op.CUSTOM:
+            # z in the body is the argument
+            step = compile_numpy(CustomFunctionNode(payload, VariableNode("z")), shader_branches=True)
+        elif op in OPERATIONS:
+            step = NUMPY[op]
+        else:
+            step = NUMPY[op], payload
+        steps.append((i, op, step, children))
+
+    freed = [{child for child in children if last_use[child] == i} for i, _, _, children in steps]     # both children can be the same node
+
+    def func(z, t, params):
+        values = {}
+        for (i, op, step, children), dropped in zip(steps, freed):
+            if op in LEAVES:
+                values[i] = as_complex(step(z, t, params))     # numpy scalars, divisions by 0 give inf like arrays
+            elif op == Op.CUSTOM:
+                values[i] = step(values[children[0]], t, params)
+            elif op in OPERATIONS:
+                values[i] = step(values[children[0]], values[children[1]])
+            else:
+                function, payload = step
+                values[i] = function(values[children[0]], payload)
+            for child in dropped:
+                del values[child]
+        return values[expression.root]
+
+    return vectorized(func)
+
+def flat_custom_functions(expression: FlatExpression) -> list[CustomFunction]:
+    # custom functions called in the expression, a function coming after the ones it calls
+    found: dict[str, CustomFunction] = {}
+    visited: set[int] = set()
+    for i in expression.reachable():
+        if expression.ops[i] == Op.CUSTOM:
+            function = expression.payloads[i]
+            custom_functions(CustomFunctionNode(function, VariableNode("z")), found, visited)
+    return list(found.values())
+
+def flat_variables(expression: FlatExpression) -> frozenset[str]:
+    # names of the base variables and parameters used, like dependencies.variables_of
+    names = set()
+    for i in expression.reachable():
+        op, payload = expression.ops[i], expression.payloads[i]
+        if op == Op.VARIABLE:
+            names |= variables_of(VariableNode(payload))
+        elif op == Op.PARAMETER:
+            names.add(payload.name)
+        elif op == Op.CUSTOM:
+            # z in the body is the argument, which is counted on its own
+            # (even when the body does not use z, unlike variables_of)
+            names |= variables_of(function_body(payload)) - {"z"}
+    return frozenset(names)
@@ -1,4 +1,5 @@
 from cmath import *
+from dataclasses import field
 from json import load, dump
 from typing import Callable, Sequence
 
@@ -48,13 +49,20 @@ class Function:
     def get_desc(self):
         return self.desc
 
-@dataclass
+@dataclass(eq=False)
 class CustomFunction:
+    # compared by identity, so that it can be part of the keys of subtrees
     name: str
     func: Node
     arg_types: Sequence[type]
     ret_types: type
     desc: str
+    # cached simplified body and GLSL definition, see codegen.function_body and codegen.glsl_definition
+    simplified: Node = field(default=None, repr=False)
+    glsl: str = field(default=None, repr=False)
+
+    def tex(self) -> str:
+        return self.func.tex()
 
 def true_phase(z: complex) -> float:
     # result in [0, 2pi]
@@ -97,7 +105,7 @@ FUNCS: dict[str,callable] = {
     }
 }
 
-DEF_FUNCS: dict[str, Node] = {}
+DEF_FUNCS: dict[str, CustomFunction] = {}
 
 def parse_tree(root_dict: dict) -> Node:
     node_type = root_dict["type"]
@@ -114,7 +122,7 @@ def dump_function(func_tree: Node):return {
         "type": func_tree.__class__.__name__
     } | {
         key: dump_function(value) if isinstance(value, Node) else value
-        for key, value in func_tree.__dict__.items()
+        for key, value in func_tree.fields().items()
     }
 
 def read_defined_functions():
@@ -123,7 +131,10 @@ def read_defined_functions():
     
     for name, data in functions.items():
         base_node: dict[str, str | int | dict] = data["tree"]
-        DEF_FUNCS[name] = parse_tree(base_node)
+        DEF_FUNCS[name] = CustomFunction(
+            name, parse_tree(base_node), (complex,), complex,
+            data.get("desc", f"Custom function ${name}(z)$.")
+        )
 
 def save_function(func_name: str, func_tree: Node):
     with open("functions.json", 'rw') as f:
@@ -135,17 +146,4 @@ def remove_function(function_name: str):
     with open("functions.json", 'rw') as f:
         functions: dict[str, dict] = load(f)
         functions.pop(function_name)
-        dump(function, f)
-
-def replace_var(func_tree: Node, param_tree: Node):
-
-    kwargs = {}
-    for key, value in func_tree.__dict__.items():
-        if isinstance(value, VariableNode) and value.value == 'z':
-            kwargs[key] = param_tree
-        elif isinstance(value, Node):
-            kwargs[key] = replace_var(value, param_tree)
-        else:
-            kwargs[key] = value
-    
-    return func_tree.__class__(**kwargs)
\ No newline at end of file
+        dump(function, f)
\ No newline at end of file
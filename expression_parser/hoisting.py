@@ -0,0 +1,66 @@
+from cmath import nan
+from typing import Sequence
+
+from expression_parser.nodes import *
+from expression_parser.codegen import is_leaf, with_children
+from expression_parser.dependencies import variables_of
+from expression_parser.evaluator import compile_point
+
+# Subtrees that do not depend on z (only on t, parameters and constants) are the same for every pixel:
+# they are moved out of the shader, evaluated once per frame on the CPU and uploaded as uniforms.
+
+MAX_HOISTED = 16    # size of the hoisted uniform array, other subtrees stay in the shader
+
+
+def glsl_declarations() -> str:
+    return f"uniform vec2 hoisted[{MAX_HOISTED}];    // subexpressions of f not depending on z, computed once per frame\n"
+
+
+class Hoister:
+
+    def __init__(self) -> None:
+        self.hoisted: list[Node] = []
+        self.indices: dict[Node, int] = {}  # hoisted subtrees, identical ones are the same node and share a uniform
+        self.dependencies: dict[int, frozenset[str]] = {}
+        self.visited: dict[int, Node] = {}  # id(node) -> rewritten node, keeps shared subtrees shared
+
+    def visit(self, node: Node) -> Node:
+        if id(node) in self.visited:
+            return self.visited[id(node)]
+
+        if is_leaf(node):
+            result = node
+        elif "z" not in variables_of(node, self.dependencies):
+            # maximal subtree without z
+            result = self.hoist(node)
+        else:
+            result = with_children(node, {
+                name: self.visit(value)
+                for name, value in node.fields().items()
+                if isinstance(value, Node)
+            })
+
+        self.visited[id(node)] = result
+        return result
+
+    def hoist(self, node: Node) -> Node:
+        if node not in self.indices:
+            if len(self.hoisted) == MAX_HOISTED:
+                return node
+            self.indices[node] = len(self.hoisted)
+            self.hoisted.append(node)
+        return HoistedNode(self.indices[node], node)
+
+
+def hoist(tree: Node) -> tuple[Node, list[Node]]:
+    # Returns the tree where the maximal subtrees not depending on z are replaced by HoistedNodes,
+    # and the hoisted subtrees, to evaluate with `evaluate` (compiled once per tree) and upload in order in the hoisted uniform.
+    hoister = Hoister()
+    return hoister.visit(tree), hoister.hoisted
+
+def evaluate(tree: Node, t: complex, params: Sequence[complex]) -> complex:
+    # Value of a tree not depending on z, with the branch cuts of the shader, invalid operations give nan like in it
+    try:
+        return compile_point(tree, shader_branches=True)(0, t, params)
+    except (ZeroDivisionError, ValueError, OverflowError):
+        return complex(nan, nan)
@@ -2,6 +2,7 @@ from cmath import pi, exp
 
 from expression_parser.constants import CONSTS
 from expression_parser.variables import VARS
+from expression_parser.parameters import PARAMS
 from expression_parser.tokens import Token, TokenType
 from expression_parser.functions import FUNCS, DEF_FUNCS
 
@@ -82,6 +83,8 @@ class Lexer:
 			return Token(TokenType.CONST, CONSTS[string])
 		if string in VARS.keys():
 			return Token(TokenType.VAR, VARS[string])
+		if string in PARAMS.keys():
+			return Token(TokenType.PARAM, PARAMS[string])
 		if string in FUNCS.keys() | DEF_FUNCS.keys():
 			return Token(TokenType.FUNC, string)
 		raise Exception(f"Unknown function or constant: \"{string}\"")
\ No newline at end of file
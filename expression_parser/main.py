@@ -1,40 +1,203 @@
 from cmath import *
+from dataclasses import replace
 
 from expression_parser.lexer import Lexer
 from expression_parser.parser_ import Parser
 from expression_parser.functions import FUNCS
 from expression_parser.nodes import *
+from expression_parser.evaluator import compile_point
+
+# Integer powers up to this exponent are computed with multiplications instead of c_pow
+MAX_INT_POWER = 64
 
 def parse_expression(expression: str) -> Node:
     return Parser(Lexer(expression).generate_tokens()).parse()
 
-def simplify_tree(tree: Node) -> Node:
+# nodes simplified with their children, other nodes are kept as they are
+SIMPLIFIED = (OperationNode, FunctionNode, CustomFunctionNode, NegateNode, ScaleNode, ShiftNode)
+
+def simplify_tree(tree: Node, memo: dict[Node, Node] | None = None) -> Node:
+    # recursive, huge expressions are simplified iteratively by flat.simplify_flat
+    # nodes are interned, a repeated subtree is simplified once
+    if not isinstance(tree, SIMPLIFIED):
+        return tree
+    if memo is None:
+        memo = {}
+    if tree not in memo:
+        memo[tree] = simplify_node(replace(tree, **{
+            name: simplify_tree(value, memo)
+            for name, value in tree.fields().items()
+            if isinstance(value, Node)
+        }))
+    return memo[tree]
+
+def simplify_node(tree: Node) -> Node:
+    # Simplifies a node whose children are already simplified
 
     to_merge = LiteralNode
 
-    # no simplification
-    if isinstance(tree, LiteralNode) or isinstance(tree, VariableNode):
-        return tree
-    
     # simplifying operations
     if isinstance(tree, OperationNode):
-        a = simplify_tree(tree.node_a)
-        b = simplify_tree(tree.node_b)
-        new_tree = tree.__class__(a, b)
-        if isinstance(a, to_merge) and isinstance(b, to_merge):
-            return NumberNode(eval(str(new_tree)))
-    
-        return new_tree
+        if isinstance(tree.node_a, to_merge) and isinstance(tree.node_b, to_merge):
+            return fold(tree)
+
+        return reduce_operation(tree)
 
     # simplifying functions
     if isinstance(tree, FunctionNode):
-        a = simplify_tree(tree.node)
-        new_tree = tree.__class__(tree.name, a)
-        if isinstance(a, to_merge):
-            return NumberNode(FUNCS[new_tree.name](eval(str(new_tree.node))))
-        
-        return new_tree
-    
+        if isinstance(tree.node, to_merge):
+            return fold(tree)
+
+        return tree
+
+    # the body of custom functions is simplified once when compiled, only their argument is
+
+    # simplifying negations, scalings and shifts
+    if isinstance(tree, (NegateNode, ScaleNode, ShiftNode)):
+        if isinstance(tree.node, to_merge):
+            return fold(tree)
+
+        return reduce_unary(tree)
+
+    return tree
+
+def fold(tree: Node) -> Node:
+    # value of a node with literal children,
+    # invalid operations (like 1/0) are left to the shader which gives nan or inf
+    try:
+        return NumberNode(compile_point(tree)())
+    except (ZeroDivisionError, ValueError, OverflowError):
+        return tree
+
+
+# ALGEBRAIC SIMPLIFICATIONS =========================================================================================
+
+def literal_value(tree: Node) -> complex | None:
+    if isinstance(tree, NumberNode):
+        return complex(tree.value)
+    if isinstance(tree, ConstantNode):
+        return complex(tree.value.eval_)
+    return None
+
+def real_literal(tree: Node) -> float | None:
+    value = literal_value(tree)
+    if value is None or value.imag != 0:
+        return None
+    return value.real
+
+def int_power(tree: Node, n: int) -> Node:
+    # exponentiation by squaring, repeated subtrees are the same node (computed once in GLSL),
+    # the products are reduced like the other ones ((-z)^3 is -(z*(z*z)))
+    if n < 0:
+        return DivideNode(NumberNode(1.0), int_power(tree, -n))
+
+    result = None
+    square = tree
+    while n:
+        if n & 1:
+            result = square if result is None else reduce_operation(MultiplyNode(result, square))
+        n >>= 1
+        if n:
+            square = reduce_operation(MultiplyNode(square, square))
+    return result
+
+def reduce_operation(tree: OperationNode) -> Node:
+    # Rewrites an operation between simplified subtrees (not both literals) into a cheaper equivalent.
+    # Note that removing annihilators (0 * z = 0) also removes nan and inf that z could produce.
+    a, b = tree.node_a, tree.node_b
+    va, vb = literal_value(a), literal_value(b)
+    ra, rb = real_literal(a), real_literal(b)
+
+    if isinstance(tree, AddNode):
+        if va == 0:
+            return b
+        if vb == 0:
+            return a
+        if ra is not None:
+            return reduce_unary(ShiftNode(b, ra))
+        if rb is not None:
+            return reduce_unary(ShiftNode(a, rb))
+        if isinstance(b, NegateNode):
+            return SubtractNode(a, b.node)
+        if isinstance(a, NegateNode):
+            return SubtractNode(b, a.node)
+
+    elif isinstance(tree, SubtractNode):
+        if vb == 0:
+            return a
+        if va == 0:
+            return reduce_unary(NegateNode(b))
+        if rb is not None:
+            return reduce_unary(ShiftNode(a, -rb))
+        if ra is not None:
+            return reduce_unary(ShiftNode(reduce_unary(NegateNode(b)), ra))
+        if isinstance(b, NegateNode):
+            return AddNode(a, b.node)
+
+    elif isinstance(tree, MultiplyNode):
+        if va == 0 or vb == 0:
+            return NumberNode(0.0)
+        if ra is not None:
+            return reduce_unary(ScaleNode(b, ra))
+        if rb is not None:
+            return reduce_unary(ScaleNode(a, rb))
+        if isinstance(a, NegateNode) and isinstance(b, NegateNode):
+            return reduce_operation(MultiplyNode(a.node, b.node))
+        # negations and scalings are pulled out of products, where they merge with the ones around
+        if isinstance(a, (NegateNode, ScaleNode)):
+            return reduce_unary(replace(a, node=reduce_operation(MultiplyNode(a.node, b))))
+        if isinstance(b, (NegateNode, ScaleNode)):
+            return reduce_unary(replace(b, node=reduce_operation(MultiplyNode(a, b.node))))
+
+    elif isinstance(tree, DivideNode):
+        if va == 0:
+            return NumberNode(0.0)
+        if rb is not None and rb != 0:
+            return reduce_unary(ScaleNode(a, 1 / rb))
+
+    elif isinstance(tree, PowerNode):
+        if vb == 0 or va == 1:
+            return NumberNode(1.0)
+        if rb is not None and rb.is_integer() and abs(rb) <= MAX_INT_POWER:
+            return int_power(a, int(rb))
+        if rb == 0.5:
+            return FunctionNode("sqrt", a)
+        if ra is not None and ra > 0:
+            # a^z = exp(log(a) z) for a positive real a
+            return FunctionNode("exp", reduce_unary(ScaleNode(b, log(ra).real)))
+
+    return tree
+
+def reduce_unary(tree: NegateNode | ScaleNode | ShiftNode) -> Node:
+    # Rewrites a negation, scaling or shift of a simplified subtree (not a literal) into a cheaper equivalent.
+    a = tree.node
+
+    if isinstance(tree, NegateNode):
+        if isinstance(a, NegateNode):
+            return a.node
+        if isinstance(a, ScaleNode):
+            return reduce_unary(ScaleNode(a.node, -a.factor))
+        if isinstance(a, SubtractNode):
+            return SubtractNode(a.node_b, a.node_a)
+
+    elif isinstance(tree, ScaleNode):
+        if tree.factor == 0:
+            return NumberNode(0.0)
+        if tree.factor == 1:
+            return a
+        if tree.factor == -1:
+            return reduce_unary(NegateNode(a))
+        if isinstance(a, ScaleNode):
+            return reduce_unary(ScaleNode(a.node, a.factor * tree.factor))
+        if isinstance(a, NegateNode):
+            return reduce_unary(ScaleNode(a.node, -tree.factor))
+
+    elif isinstance(tree, ShiftNode):
+        if tree.shift == 0:
+            return a
+        if isinstance(a, ShiftNode):
+            return reduce_unary(ShiftNode(a.node, a.shift + tree.shift))
+
     return tree
 
 
@@ -52,4 +215,4 @@ if __name__ == "__main__":
         except Exception as e:
             print(e)
             continue
-        break
\ No newline at end of file
+        break
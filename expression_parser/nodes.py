@@ -1,13 +1,45 @@
 from dataclasses import dataclass
-from abc import ABC, abstractmethod
+from abc import ABC, ABCMeta, abstractmethod
+from weakref import WeakValueDictionary
 
-# from typing import TYPE_CHECKING
-# if TYPE_CHECKING:
-# 	from expression_parser.variables import Variable
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+	# from expression_parser.variables import Variable
+	from expression_parser.functions import CustomFunction
 from expression_parser.constants import Constant
+from expression_parser.parameters import Parameter
+
+# Nodes are immutable and interned: building a node equal to an existing one returns the existing one.
+# Identical subtrees are the same object, nodes are compared and hashed by identity,
+# and the memory used grows with the number of distinct subexpressions.
+
+INTERNED: "WeakValueDictionary[tuple, Node]" = WeakValueDictionary()
+
+def value_key(value) -> object:
+	# floats by representation (0.0 and -0.0 are different nodes),
+	# constants, variables and parameters (not hashable) by identity, nodes by identity
+	if isinstance(value, (float, complex)):
+		return (type(value), repr(value))
+	try:
+		hash(value)
+	except TypeError:
+		return id(value)
+	return value
+
+class Interned(ABCMeta):
+	def __call__(cls, *args, **kwargs):
+		node = super().__call__(*args, **kwargs)
+		key = (cls,) + tuple(value_key(getattr(node, name)) for name in cls.__match_args__)
+		return INTERNED.setdefault(key, node)
+
+node_dataclass = dataclass(frozen=True, slots=True, eq=False, weakref_slot=True)
+
+@node_dataclass
+class Node(ABC, metaclass=Interned):
+	def fields(self) -> dict[str, object]:
+		# values of the fields by name, children included
+		return {name: getattr(self, name) for name in self.__match_args__}
 
-@dataclass
-class Node(ABC):
 	@abstractmethod
 	def glsl(self) -> str:
 		pass
@@ -16,11 +48,15 @@ class Node(ABC):
 	def tex(self) -> str:
 		pass
 
+	@abstractmethod
+	def numpy(self) -> str:
+		pass
+
 	@abstractmethod
 	def __repr__(self) -> str:
 		pass
 
-@dataclass
+@node_dataclass
 class VariableNode(Node):
 	value: str # | Variable
 
@@ -33,23 +69,54 @@ class VariableNode(Node):
 		if isinstance(self.value, str):
 			return self.value
 		return self.value.latex
+
+	def numpy(self) -> str:
+		if isinstance(self.value, str):
+			return self.value
+		return self.value.subtree.numpy()
 	
 	def __repr__(self) -> str:
 		return self.value.name
 
-@dataclass
+# Complex values in the generated code, the NumPy ones are numpy scalars
+# so that invalid operations on literals give nan or inf like arrays instead of raising (e.g. 1/0)
+
+def glsl_complex(real, imag) -> str:
+	return f"complex({real}, {imag})"
+
+def numpy_complex(value: complex) -> str:
+	return f"np_complex({value.real!r}, {value.imag!r})"
+
+@node_dataclass
+class ParameterNode(Node):
+	# value set with a uniform, not a literal so that it is not folded
+	value: Parameter
+
+	def glsl(self) -> str:
+		return glsl_complex(f"params[{self.value.index}].x", f"params[{self.value.index}].y")
+
+	def tex(self) -> str:
+		return self.value.latex
+
+	def numpy(self) -> str:
+		return f"params[{self.value.index}]"
+
+	def __repr__(self) -> str:
+		return self.value.name
+
+@node_dataclass
 class LiteralNode(Node):
 	value: complex | Constant
 	
 	def __repr__(self) -> str:
 		return str(self.value)
 
-@dataclass
+@node_dataclass
 class NumberNode(LiteralNode):
 	value: complex
 
 	def glsl(self) -> str:
-		return f"complex({self.value.real}, {self.value.imag})"
+		return glsl_complex(self.value.real, self.value.imag)
 	
 	def tex(self) -> str:
 		if self.value == 0:
@@ -64,10 +131,13 @@ class NumberNode(LiteralNode):
 			imag = f"{imag}i"
 		return f"{real} + {imag}"
 
+	def numpy(self) -> str:
+		return numpy_complex(complex(self.value))
+
 	def __repr__(self) -> str:
-		return super().__repr__()
+		return LiteralNode.__repr__(self)
 
-@dataclass
+@node_dataclass
 class ConstantNode(LiteralNode):
 	value: Constant
 
@@ -77,21 +147,27 @@ class ConstantNode(LiteralNode):
 	def tex(self):
 		return self.value.latex
 
+	def numpy(self):
+		return numpy_complex(complex(self.value.eval_))
+
 	def __repr__(self) -> str:
-		return super().__repr__()
+		return LiteralNode.__repr__(self)
 
-@dataclass
+@node_dataclass
 class OperationNode(Node):
 	node_a: Node
 	node_b: Node
 
-@dataclass
+@node_dataclass
 class AddNode(OperationNode):
 	node_a: Node
 	node_b: Node
 
 	def glsl(self) -> str:
 		return f"c_add({self.node_a.glsl()}, {self.node_b.glsl()})"
+
+	def numpy(self) -> str:
+		return f"({self.node_a.numpy()} + {self.node_b.numpy()})"
 	
 	def tex(self) -> str:
 		return f"({self.node_a.tex()} + {self.node_b.tex()})"
@@ -99,13 +175,16 @@ class AddNode(OperationNode):
 	def __repr__(self) -> str:
 		return f"({self.node_a} + {self.node_b})"
 
-@dataclass
+@node_dataclass
 class SubtractNode(OperationNode):
 	node_a: Node
 	node_b: Node
 
 	def glsl(self) -> str:
 		return f"c_sub({self.node_a.glsl()}, {self.node_b.glsl()})"
+
+	def numpy(self) -> str:
+		return f"({self.node_a.numpy()} - {self.node_b.numpy()})"
 	
 	def tex(self) -> str:
 		return f"({self.node_a.tex()} - {self.node_b.tex()})"
@@ -113,13 +192,16 @@ class SubtractNode(OperationNode):
 	def __repr__(self) -> str:
 		return f"({self.node_a} - {self.node_b})"
 
-@dataclass
+@node_dataclass
 class MultiplyNode(OperationNode):
 	node_a: Node
 	node_b: Node
 
 	def glsl(self) -> str:
 		return f"c_mult({self.node_a.glsl()}, {self.node_b.glsl()})"
+
+	def numpy(self) -> str:
+		return f"({self.node_a.numpy()} * {self.node_b.numpy()})"
 	
 	def tex(self) -> str:
 		return f"{{{self.node_a.tex()}}} \\cdot {{{self.node_b.tex()}}}"
@@ -127,13 +209,16 @@ class MultiplyNode(OperationNode):
 	def __repr__(self) -> str:
 		return f"({self.node_a} * {self.node_b})"
 
-@dataclass
+@node_dataclass
 class DivideNode(OperationNode):
 	node_a: Node
 	node_b: Node
 
 	def glsl(self) -> str:
 		return f"c_div({self.node_a.glsl()}, {self.node_b.glsl()})"
+
+	def numpy(self) -> str:
+		return f"({self.node_a.numpy()} / {self.node_b.numpy()})"
 	
 	def tex(self) -> str:
 		return f"\\frac{{{self.node_a.tex()}}} {{{self.node_b.tex()}}}"
@@ -141,13 +226,16 @@ class DivideNode(OperationNode):
 	def __repr__(self) -> str:
 		return f"({self.node_a} / {self.node_b})"
 
-@dataclass
+@node_dataclass
 class PowerNode(OperationNode):
 	node_a: Node
 	node_b: Node
 
 	def glsl(self) -> str:
 		return f"c_pow({self.node_a.glsl()}, {self.node_b.glsl()})"
+
+	def numpy(self) -> str:
+		return f"np_pow({self.node_a.numpy()}, {self.node_b.numpy()})"
 	
 	def tex(self) -> str:
 		return f"{{{self.node_a.tex()}}}^{{{self.node_b.tex()}}}"
@@ -155,16 +243,113 @@ class PowerNode(OperationNode):
 	def __repr__(self) -> str:
 		return f"({self.node_a} ** {self.node_b})"
 
-@dataclass
+@node_dataclass
 class FunctionNode(Node):
 	name: str
 	node: Node
 	
 	def glsl(self) -> str:
 		return f"c_{self.name}({self.node.glsl()})"
+
+	def numpy(self) -> str:
+		return f"np_{self.name}({self.node.numpy()})"
 	
 	def tex(self) -> str:
 		return f"{self.name}({{{self.node.tex()}}})"
 	
 	def __repr__(self) -> str:
 		return f"{self.name}({self.node})"
+
+@node_dataclass
+class CustomFunctionNode(Node):
+	# call to a function of functions.json, defined once as a GLSL function u_name
+	value: "CustomFunction"
+	node: Node
+
+	def glsl(self) -> str:
+		return f"u_{self.value.name}({self.node.glsl()})"
+
+	def numpy(self) -> str:
+		# the body is a function of z
+		return f"(lambda z: {self.value.func.numpy()})({self.node.numpy()})"
+
+	def tex(self) -> str:
+		return f"{self.value.name}({{{self.node.tex()}}})"
+
+	def __repr__(self) -> str:
+		return f"{self.value.name}({self.node})"
+
+
+# Nodes produced by simplification
+
+@node_dataclass
+class NegateNode(Node):
+	node: Node
+
+	def glsl(self) -> str:
+		return f"c_neg({self.node.glsl()})"
+
+	def numpy(self) -> str:
+		return f"(-{self.node.numpy()})"
+
+	def tex(self) -> str:
+		return f"(-{self.node.tex()})"
+
+	def __repr__(self) -> str:
+		return f"(-{self.node})"
+
+@node_dataclass
+class ScaleNode(Node):
+	# multiplication by a real number
+	node: Node
+	factor: float
+
+	def glsl(self) -> str:
+		return f"c_scale({self.node.glsl()}, {float(self.factor)!r})"
+
+	def numpy(self) -> str:
+		return f"({self.node.numpy()} * {float(self.factor)!r})"
+
+	def tex(self) -> str:
+		return f"{{{self.factor}}} \\cdot {{{self.node.tex()}}}"
+
+	def __repr__(self) -> str:
+		return f"({self.node} * {float(self.factor)!r})"
+
+@node_dataclass
+class ShiftNode(Node):
+	# addition of a real number
+	node: Node
+	shift: float
+
+	def glsl(self) -> str:
+		return f"c_shift({self.node.glsl()}, {float(self.shift)!r})"
+
+	def numpy(self) -> str:
+		return f"({self.node.numpy()} + {float(self.shift)!r})"
+
+	def tex(self) -> str:
+		return f"({self.node.tex()} + {self.shift})"
+
+	def __repr__(self) -> str:
+		return f"({self.node} + {float(self.shift)!r})"
+
+# Nodes produced by hoisting
+
+@node_dataclass
+class HoistedNode(Node):
+	# subtree not depending on z, evaluated once per frame on the CPU and read from a uniform
+	index: int
+	node: Node
+
+	def glsl(self) -> str:
+		return glsl_complex(f"hoisted[{self.index}].x", f"hoisted[{self.index}].y")
+
+	def tex(self) -> str:
+		return self.node.tex()
+
+	def numpy(self) -> str:
+		return self.node.numpy()
+
+	def __repr__(self) -> str:
+		return repr(self.node)
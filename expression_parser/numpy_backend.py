@@ -0,0 +1,122 @@
+from cmath import inf, nan, pi
+from typing import Callable, Sequence
+
+import numpy as np
+
+from expression_parser.functions import FUNCS
+from expression_parser.nodes import Node
+from expression_parser.parameters import PARAMS
+
+
+def as_complex(x) -> np.ndarray:
+    return np.asarray(x, dtype=np.complex128)
+
+def true_phase(z: np.ndarray) -> np.ndarray:
+    # result in [0, 2pi], same convention as functions.true_phase
+    p = np.angle(z)
+    return as_complex(np.where(p < 0, p + 2 * pi, p))
+
+# Vectorized counterparts of every function in FUNCS,
+# real valued functions return complex arrays like in the shader.
+NP_FUNCS: dict[str, Callable[[np.ndarray], np.ndarray]] = {
+    "re": lambda z: as_complex(np.real(z)),
+    "im": lambda z: as_complex(np.imag(z)),
+    "conj": np.conj,
+    "arg": true_phase,
+    "abs": lambda z: as_complex(np.abs(z)),
+    "exp": np.exp,
+    "log": np.log,
+    "log10": np.log10,
+    "sqrt": np.sqrt,
+    "sin": np.sin,
+    "cos": np.cos,
+    "tan": np.tan,
+    "asin": np.arcsin,
+    "acos": np.arccos,
+    "atan": np.arctan,
+    "sinh": np.sinh,
+    "cosh": np.cosh,
+    "tanh": np.tanh,
+    "asinh": np.arcsinh,
+    "acosh": np.arccosh,
+    "atanh": np.arctanh,
+}
+
+assert NP_FUNCS.keys() == FUNCS.keys(), "every function needs a numpy implementation"
+
+
+# Same functions with the branch cuts of fragment_shader/complex.glsl, where the argument is in [0, 2pi[
+# (the shader's log, sqrt and powers differ from the principal ones below the real axis).
+
+def shader_log(z: np.ndarray) -> np.ndarray:
+    return np.log(np.abs(z)) + 1j * true_phase(z)
+
+def shader_sqrt(z: np.ndarray) -> np.ndarray:
+    return np.sqrt(np.abs(z)) * np.exp(0.5j * true_phase(z))
+
+def shader_pow(z1: np.ndarray, z2: np.ndarray) -> np.ndarray:
+    r1, t1 = np.abs(z1), true_phase(z1)
+    return (r1 ** z2.real * np.exp(-z2.imag * t1)) * np.exp(1j * (z2.imag * np.log(r1) + t1 * z2.real))
+
+def shader_asin(z: np.ndarray) -> np.ndarray:
+    return -1j * shader_log(1j * z + shader_sqrt(1 - z * z))
+
+def shader_acos(z: np.ndarray) -> np.ndarray:
+    return -1j * shader_log(z + shader_sqrt(z * z - 1))
+
+def shader_atan(z: np.ndarray) -> np.ndarray:
+    return 0.5j * shader_log((1 - 1j * z) / (1 + 1j * z))
+
+def shader_asinh(z: np.ndarray) -> np.ndarray:
+    return shader_log(z + shader_sqrt(z * z + 1))
+
+def shader_acosh(z: np.ndarray) -> np.ndarray:
+    return shader_log(z + shader_sqrt(z * z - 1))
+
+def shader_atanh(z: np.ndarray) -> np.ndarray:
+    return 0.5 * shader_log((1 + z) / (1 - z))
+
+SHADER_FUNCS: dict[str, Callable[[np.ndarray], np.ndarray]] = NP_FUNCS | {
+    "log": shader_log,
+    "log10": lambda z: shader_log(z) / np.log(10),
+    "sqrt": shader_sqrt,
+    "asin": shader_asin,
+    "acos": shader_acos,
+    "atan": shader_atan,
+    "asinh": shader_asinh,
+    "acosh": shader_acosh,
+    "atanh": shader_atanh,
+}
+
+def namespace(functions: dict[str, Callable], power: Callable) -> dict[str, Callable]:
+    return {"inf": inf, "nan": nan, "np_complex": np.complex128, "np_pow": power} | {
+        "np_" + name: func
+        for name, func in functions.items()
+    }
+
+NAMESPACE = namespace(NP_FUNCS, np.power)
+SHADER_NAMESPACE = namespace(SHADER_FUNCS, shader_pow)
+
+
+def compile_numpy(tree: Node, shader_branches: bool = False) -> Callable[[np.ndarray, complex, Sequence[complex]], np.ndarray]:
+    # Compiles a (simplified) tree once into a function evaluating f(z) on a whole array of points.
+    # The returned function takes any array-like of z values, the time t (in seconds)
+    # and the values of the parameters (0 by default), and returns a complex128 array with the shape of z.
+    # With shader_branches, multivalued functions take the same values as in the shader.
+    return vectorized(eval(f"lambda z, t, params: {tree.numpy()}", SHADER_NAMESPACE if shader_branches else NAMESPACE))
+
+def vectorized(func: Callable) -> Callable[[np.ndarray, complex, Sequence[complex]], np.ndarray]:
+    # f(z, t, params) as returned by compile_numpy, from func computing it on complex arrays (or scalars)
+
+    def f(z: np.ndarray, t: complex = 0, params: Sequence[complex] = (0,) * len(PARAMS)) -> np.ndarray:
+        z = as_complex(z)
+        with np.errstate(all="ignore"):
+            # like in the shader, invalid values give nan or inf instead of raising
+            # (t and the parameters are numpy scalars, a parameter divided by 0 does not raise either)
+            res = as_complex(func(z, np.complex128(t), [np.complex128(value) for value in params]))
+        if res.shape != z.shape:
+            # expression does not depend on z
+            res = np.broadcast_to(res, z.shape).copy()
+        return res
+
+    return f
@@ -0,0 +1,25 @@
+from dataclasses import dataclass
+
+
+@dataclass
+class Parameter:
+    name: str
+    index: int  # position in the params uniform array
+    latex: str
+    desc: str
+
+    def __repr__(self) -> str:
+        return self.name
+
+
+# Parameters are given values in the settings window,
+# they are uniforms of the shader so changing them does not need any recompilation.
+PARAMS = {
+    name: Parameter(name, index, name,
+        f"${name}$ is a parameter, its value is set in the settings window (changing it is instant).")
+    for index, name in enumerate("abcd")
+}
+
+def glsl_declarations() -> str:
+    # declarations of the uniforms holding the values of the parameters
+    return f"uniform vec2 params[{len(PARAMS)}];    // values of the parameters {", ".join(PARAMS)}\n"
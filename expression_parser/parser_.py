@@ -1,6 +1,6 @@
 from expression_parser.tokens import Token, TokenType
 from expression_parser.nodes import *
-from expression_parser.functions import FUNCS, DEF_FUNCS, replace_var
+from expression_parser.functions import FUNCS, DEF_FUNCS
 
 class Parser:
 	def __init__(self, tokens):
@@ -91,8 +91,8 @@ class Parser:
 			# TODO : handle multiple variable functions
 
 			if token.value not in FUNCS.keys():
-				# custom defined function, replace var with result node
-				return replace_var(DEF_FUNCS[token.value], args[0])
+				# custom defined function, compiled separately
+				return CustomFunctionNode(DEF_FUNCS[token.value], args[0])
 			
 			# built in function
 			return FunctionNode(token.value, args[0])
@@ -119,12 +119,16 @@ class Parser:
 			self.advance()
 			return VariableNode(token.value)
 
+		if token.type == TokenType.PARAM:
+			self.advance()
+			return ParameterNode(token.value)
+
 		if token.type == TokenType.PLUS:
 			self.advance()
 			return self.factor()
 		
 		if token.type == TokenType.MINUS:
 			self.advance()
-			return MultiplyNode(NumberNode(-1), self.factor())
+			return NegateNode(self.factor())
 		
 		self.raise_error()
@@ -3,6 +3,7 @@ from dataclasses import dataclass
 
 from expression_parser.constants import Constant
 from expression_parser.variables import Variable
+from expression_parser.parameters import Parameter
 
 class TokenType(Enum):
 	NUMBER    	= 0
@@ -17,11 +18,12 @@ class TokenType(Enum):
 	RPAREN    	= 9
 	FUNC		= 10
 	COMA		= 11
+	PARAM		= 12
 
 @dataclass
 class Token:
 	type: TokenType
-	value: str | complex | Constant | Variable = None
+	value: str | complex | Constant | Variable | Parameter = None
 
 	def __repr__(self):
 		return self.type.name + (f":{self.value}" if self.value != None else "")
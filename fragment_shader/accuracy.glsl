@@ -0,0 +1,13 @@
+
+// Compute shader evaluating a complex function on a list of points, see accuracy.py
+layout(local_size_x = 64) in;
+layout(std430, binding = 0) readonly buffer Inputs { vec2 inputs[]; };
+layout(std430, binding = 1) writeonly buffer Outputs { vec2 outputs[]; };
+
+void main() {
+    uint i = gl_GlobalInvocationID.x;
+    if (i >= inputs.length()) return;
+    complex z = complex(inputs[i].x, inputs[i].y);
+    complex w = FUNCTION;
+    outputs[i] = vec2(w.x, w.y);
+}
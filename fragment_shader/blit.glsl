@@ -0,0 +1,13 @@
+#version 450 core
+
+// Draws a render made at another resolution (see shader_builder.RenderTarget),
+// linear filtering upscales previews and averages 2x2 samples when supersampling.
+
+layout(binding = 2) uniform sampler2D image;
+
+in vec2 uvs;
+out vec4 f_color;
+
+void main() {
+    f_color = texture(image, uvs * 0.5 + 0.5);
+}
@@ -355,3 +355,18 @@ vec4 hsl_to_rgba(vec3 hsl) {
     return vec4((color + vec3(hsl.z - c/2.f)).rgb, 1.f);
     // r, g, b and a should be in [0, 1]
 }
+
+
+#if COLORMAP == 2
+// okhsl_to_srgba baked in a 3D texture (hue, saturation, lightness) by okhsl_table.glsl,
+// see shader_builder.OkhslTable for its size and error bound
+layout(binding = 1) uniform sampler3D okhsl_table;
+
+vec4 okhsl_table_to_srgba(vec3 hsl)
+{
+    vec3 size = vec3(textureSize(okhsl_table, 0));
+    // samples between texel centers, the hue wraps around while saturation and lightness include both ends
+    vec3 uvw = vec3(hsl.x + 0.5 / size.x, (hsl.yz * (size.yz - 1.f) + 0.5) / size.yz);
+    return texture(okhsl_table, uvw);
+}
+#endif
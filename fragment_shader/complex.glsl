@@ -4,6 +4,8 @@ struct complex {
 };
 
 // Complex functions
+// With FAST_MATH, some functions are replaced by faster versions sharing work between the real and imaginary parts,
+// or using approximations, run accuracy.py to see how much precision they lose.
 complex c_re(complex z) {
     return complex(z.x, 0);
 }
@@ -16,11 +18,26 @@ complex c_conj(complex z) {
     return complex(z.x, -z.y);
 }
 
+#if FAST_MATH
+complex c_arg(complex z) {
+    // polynomial approximation of atan on [0, 1], then moved to the right octant
+    float ax = abs(z.x), ay = abs(z.y);
+    float mx = max(ax, ay);
+    float a = mx == 0 ? 0 : min(ax, ay) / mx;
+    float s = a * a;
+    float val = a * (0.99997726 + s * (-0.33262347 + s * (0.19354346 + s * (-0.11643287 + s * (0.05265332 - s * 0.01172120)))));
+    val = ay > ax ? pi/2 - val : val;
+    val = z.x < 0 ? pi - val : val;
+    val = z.y < 0 ? 2*pi - val : val;
+    return complex(val, 0);
+}
+#else
 complex c_arg(complex z) {
     float val = atan(z.y, z.x);
     val = val < 0 ? val + 2*pi : val;
     return complex(val, 0);
 }
+#endif
 
 complex c_abs(complex z) {
     return complex(length(vec2(z.x, z.y)), 0);
@@ -38,6 +55,18 @@ complex c_sub(complex z1, complex z2) {
     return complex(z1.x - z2.x, z1.y - z2.y);
 }
 
+complex c_neg(complex z) {
+    return complex(-z.x, -z.y);
+}
+
+complex c_scale(complex z, float k) {
+    return complex(k * z.x, k * z.y);
+}
+
+complex c_shift(complex z, float k) {
+    return complex(z.x + k, z.y);
+}
+
 complex c_inv(complex z) {
     complex c_z = c_conj(z);
     float d = (z.x*z.x + z.y*z.y);
@@ -52,6 +81,25 @@ complex c_div(complex z1, complex z2) {
     return c_mult(z1, c_inv(z2));
 }
 
+#if FAST_MATH
+complex c_pow(complex z1, complex z2) {
+    if (z2.y == 0 && z2.x == floor(z2.x) && abs(z2.x) <= 64) {
+        // integer exponent, by squaring
+        int n = int(abs(z2.x));
+        complex res = complex(1, 0);
+        complex sq = z1;
+        while (n > 0) {
+            if ((n & 1) == 1) res = c_mult(res, sq);
+            sq = c_mult(sq, sq);
+            n >>= 1;
+        }
+        return z2.x < 0 ? c_inv(res) : res;
+    }
+    float logr1 = 0.5 * log(z1.x*z1.x + z1.y*z1.y);
+    float t1 = c_arg(z1).x;
+    return c_rect(exp(z2.x*logr1 - z2.y*t1), z2.y*logr1 + z2.x*t1);
+}
+#else
 complex c_pow(complex z1, complex z2) {
     float r1 = c_abs(z1).x;
     float t1 = c_arg(z1).x;
@@ -59,19 +107,62 @@ complex c_pow(complex z1, complex z2) {
     float t3 = z2.y * log(r1) + t1 * z2.x;
     return c_rect(r3, t3);
 }
+#endif
 
 complex c_exp(complex z) {
     return c_rect(exp(z.x), z.y);
 }
 
+#if FAST_MATH
+complex c_log(complex z) {
+    // log|z| without the square root
+    return complex(0.5 * log(z.x*z.x + z.y*z.y), c_arg(z).x);
+}
+#else
 complex c_log(complex z) {
     return complex(log(c_abs(z).x), c_arg(z).x);
 }
+#endif
 
 complex c_log10(complex z) {
     return c_mult(complex(log10e, 0), c_log(z));
 }
 
+#if FAST_MATH
+// cosh and sinh from a single exponential
+vec2 coshsinh(float x) {
+    float ex = exp(x);
+    float inv_ex = 1 / ex;
+    return vec2(ex + inv_ex, ex - inv_ex) * 0.5;
+}
+
+complex c_sqrt(complex z) {
+    // without trigonometry, same branch as the exact version (Im >= 0)
+    float r = c_abs(z).x;
+    float a = sqrt(max(0.5 * (r + z.x), 0));
+    float b = sqrt(max(0.5 * (r - z.x), 0));
+    return complex(z.y < 0 ? -a : a, b);
+}
+
+complex c_sin(complex z) {
+    vec2 ch_sh = coshsinh(z.y);
+    return complex(sin(z.x) * ch_sh.x, cos(z.x) * ch_sh.y);
+}
+
+complex c_cos(complex z) {
+    vec2 ch_sh = coshsinh(z.y);
+    return complex(cos(z.x) * ch_sh.x, -sin(z.x) * ch_sh.y);
+}
+
+complex c_tan(complex z) {
+    // tan(x+iy) = (sin(x)cos(x) + i sinh(y)cosh(y)) / (cos(x)^2 + sinh(y)^2), i*sign(y) when sinh(y)^2 would overflow
+    if (abs(z.y) > 20) return complex(0, sign(z.y));
+    vec2 ch_sh = coshsinh(z.y);
+    float s = sin(z.x), c = cos(z.x);
+    float d = c*c + ch_sh.y*ch_sh.y;
+    return complex(s*c / d, ch_sh.y*ch_sh.x / d);
+}
+#else
 complex c_sqrt(complex z) {
     return c_rect(sqrt(c_abs(z).x), c_arg(z).x/2);
 }
@@ -87,6 +178,7 @@ complex c_cos(complex z) {
 complex c_tan(complex z) {
     return c_div(c_sin(z), c_cos(z));
 }
+#endif
 
 complex c_asin(complex z) {
     complex root = c_sqrt(c_sub(complex(1.0, 0.0), c_mult(z,z)));
@@ -104,6 +196,26 @@ complex c_atan(complex z) {
     return c_mult(complex(0, 0.5), c_log(complex(x/d, -2 * z.x / d)));
 }
 
+#if FAST_MATH
+complex c_sinh(complex z) {
+    vec2 ch_sh = coshsinh(z.x);
+    return complex(ch_sh.y * cos(z.y), ch_sh.x * sin(z.y));
+}
+
+complex c_cosh(complex z) {
+    vec2 ch_sh = coshsinh(z.x);
+    return complex(ch_sh.x * cos(z.y), ch_sh.y * sin(z.y));
+}
+
+complex c_tanh(complex z) {
+    // tanh(x+iy) = (sinh(x)cosh(x) + i sin(y)cos(y)) / (sinh(x)^2 + cos(y)^2), sign(x) when sinh(x)^2 would overflow
+    if (abs(z.x) > 20) return complex(sign(z.x), 0);
+    vec2 ch_sh = coshsinh(z.x);
+    float s = sin(z.y), c = cos(z.y);
+    float d = ch_sh.y*ch_sh.y + c*c;
+    return complex(ch_sh.y*ch_sh.x / d, s*c / d);
+}
+#else
 complex c_sinh(complex z) {
     return complex(sinh(z.x) * cos(z.y), cosh(z.x) * sin(z.y));
 }
@@ -115,6 +227,7 @@ complex c_cosh(complex z) {
 complex c_tanh(complex z) {
     return c_div(c_sinh(z), c_cosh(z));
 }
+#endif
 
 complex c_asinh(complex z) {
     complex z2 = complex(z.x * z.x - z.y * z.y, 2 * z.x * z.y);
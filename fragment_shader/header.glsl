@@ -3,3 +3,6 @@
 #define pi      3.14159265358979311599796346854418516
 #define e       2.71828182845904523536028747135266249
 #define log10e  0.43429448190325176115678118549112696
+
+// parameters and hoisted subexpressions of f, see expression_parser/parameters.py and hoisting.py
+DECLARATIONS
\ No newline at end of file
@@ -0,0 +1,50 @@
+// Stack machine evaluating the bytecode of f (see expression_parser/bytecode.py),
+// changing f only means uploading a new program to the buffer, the shader is compiled once.
+
+DEFINITIONS
+
+layout(std140, binding = 0) uniform Bytecode {
+    int code_length;
+    ivec4 code[CODE_SIZE / 4];              // 4 instructions per ivec4 : opcode | argument << 8
+    vec4 constants[CONSTANT_COUNT / 2];     // 2 complex numbers per vec4
+};
+
+complex constant(int i) {
+    vec4 pair = constants[i >> 1];
+    return (i & 1) == 0 ? complex(pair.x, pair.y) : complex(pair.z, pair.w);
+}
+
+complex interpret(complex z, complex t) {
+    complex stack[STACK_SIZE];
+    complex registers[REGISTER_COUNT];
+    int top = -1;
+
+    for (int i = 0; i < code_length; i++) {
+        int instruction = code[i >> 2][i & 3];
+        int arg = instruction >> 8;
+
+        switch (instruction & 255) {
+            case OP_Z: stack[++top] = z; break;
+            case OP_T: stack[++top] = t; break;
+            case OP_CONST: stack[++top] = constant(arg); break;
+            case OP_PARAM: stack[++top] = complex(params[arg].x, params[arg].y); break;
+            case OP_HOISTED: stack[++top] = complex(hoisted[arg].x, hoisted[arg].y); break;
+            case OP_LOAD: stack[++top] = registers[arg]; break;
+            case OP_STORE: registers[arg] = stack[top]; break;
+
+            case OP_ADD: top--; stack[top] = c_add(stack[top], stack[top+1]); break;
+            case OP_SUB: top--; stack[top] = c_sub(stack[top], stack[top+1]); break;
+            case OP_MULT: top--; stack[top] = c_mult(stack[top], stack[top+1]); break;
+            case OP_DIV: top--; stack[top] = c_div(stack[top], stack[top+1]); break;
+            case OP_POW: top--; stack[top] = c_pow(stack[top], stack[top+1]); break;
+
+            case OP_NEG: stack[top] = c_neg(stack[top]); break;
+            case OP_SCALE: stack[top] = c_scale(stack[top], constant(arg).x); break;
+            case OP_SHIFT: stack[top] = c_shift(stack[top], constant(arg).x); break;
+
+            FUNCTION_CASES
+        }
+    }
+
+    return stack[0];
+}
@@ -0,0 +1,12 @@
+
+// Compute shader baking okhsl_to_srgba in the table sampled by okhsl_table_to_srgba (see shader_builder.OkhslTable)
+layout(local_size_x = 4, local_size_y = 4, local_size_z = 4) in;
+layout(rgba16f, binding = 0) uniform writeonly image3D table;
+
+void main() {
+    ivec3 texel = ivec3(gl_GlobalInvocationID);
+    ivec3 size = imageSize(table);
+    // texel i is hue i/size.x (the hue wraps around), saturation and lightness go from 0 to 1 included
+    vec3 hsl = vec3(texel) / vec3(size.x, size.y - 1, size.z - 1);
+    imageStore(table, texel, okhsl_to_srgba(hsl));
+}
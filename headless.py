@@ -0,0 +1,194 @@
+from argparse import ArgumentParser
+
+import numpy as np
+import moderngl
+
+from expression_parser.functions import read_defined_functions
+from shader_builder import QUAD_VERTICES, ENGINES, BytecodeBuffer, OkhslTable, ProgramCache, shader_defines, write_complex_array
+from compilation import Compilation, compile_expression
+from expression_parser.parameters import PARAMS
+from expression_parser.hoisting import evaluate
+from image_writer import ImageWriter, open_writer
+
+# Default settings, same as the ones of the settings window
+DEFAULT_STYLE = 12  # HSL, arg(f(z)) as hue, |f(z)| as luminosity, no style lines
+DEFAULT_K = (1.0, 1.0, 1.0, 6.0)
+DEFAULT_SCALE = 10 ** 2.2
+DEFAULT_PARAMETERS = (0j,) * len(PARAMS)
+# Tiles are rendered band by band, a band being a row of tiles (rows of pixels are written to files in order)
+DEFAULT_TILE_SIZE = (4096, 256)
+
+
+class HeadlessRenderer:
+    # Renders expressions without any window, using a standalone OpenGL context
+
+    def __init__(self, backend: str | None = None) -> None:
+        self.ctx = create_standalone_context(backend)
+        self.quad_buffer = self.ctx.buffer(data=QUAD_VERTICES)
+        self.programs = ProgramCache(self.ctx, self.quad_buffer)
+        self.bytecode_buffer = BytecodeBuffer(self.ctx)
+        self.okhsl_table = OkhslTable(self.ctx)
+        self.program = None
+        self.render_object = None
+        self.hoisted = []
+        self.compilation = None
+        self.engine = None
+        self.fast_math = False
+        self.defines = None
+
+    def load_expression(self, expression: str, engine: str = "glsl", fast_math: bool = False):
+        # raises an Exception if the expression is invalid or if the shader does not compile
+        compilation = compile_expression(expression)
+        self.fast_math = fast_math
+        self.load_program(compilation, engine, shader_defines(DEFAULT_STYLE, fast_math))
+        self.hoisted = compilation.hoisted[1]
+
+    def load_program(self, compilation: Compilation, engine: str, defines: dict[str, int]):
+        self.program, self.render_object = compilation.program(engine, defines, self.programs, self.bytecode_buffer)
+        self.compilation, self.engine, self.defines = compilation, engine, defines
+
+    def set_uniforms(
+        self, origin: tuple[float, float], scale: float,
+        style: int, K: tuple[float, float, float, float], t: float,
+        parameters: tuple[complex, ...] = DEFAULT_PARAMETERS
+    ):
+        # the style is compiled in the shader
+        defines = shader_defines(style, self.fast_math)
+        if defines != self.defines:
+            self.load_program(self.compilation, self.engine, defines)
+
+        params = {}
+        params["origin"] = origin
+        params["scale"] = scale
+        params["K"] = tuple(K)
+        params["t_real"] = int(t * 1000) % 4294967296 # modulo max uint
+        for key, value in params.items():
+            if key in self.program:
+                self.program[key] = value
+        write_complex_array(self.program, "params", list(parameters))
+        t = complex(params["t_real"] / 1000)
+        write_complex_array(self.program, "hoisted", [evaluate(node, t, parameters) for node in self.hoisted])
+
+    def render_area(self, fbo: moderngl.Framebuffer, size: tuple[int, int], offset: tuple[float, float]) -> np.ndarray:
+        # Renders the area of the view of the given size, centered on offset (in pixels from the center of the view).
+        # returns a (height, width, 4) uint8 RGBA array, top row first
+        for key, value in (("size", size), ("offset", offset)):
+            if key in self.program:
+                self.program[key] = value
+
+        width, height = size
+        fbo.use()
+        self.bytecode_buffer.use()
+        self.okhsl_table.use()
+        fbo.viewport = (0, 0, width, height)
+        self.render_object.render(mode=moderngl.TRIANGLE_STRIP)
+        data = fbo.read(viewport=(0, 0, width, height), components=4, alignment=1)
+
+        # OpenGL reads the bottom row first
+        return np.frombuffer(data, dtype=np.uint8).reshape(height, width, 4)[::-1]
+
+    def render(
+        self, size: tuple[int, int],
+        origin: tuple[float, float] = (0, 0), scale: float = DEFAULT_SCALE,
+        style: int = DEFAULT_STYLE, K: tuple[float, float, float, float] = DEFAULT_K,
+        t: float = 0, parameters: tuple[complex, ...] = DEFAULT_PARAMETERS
+    ) -> np.ndarray:
+        # returns a (height, width, 4) uint8 RGBA array, top row first
+        self.set_uniforms(origin, scale, style, K, t, parameters)
+
+        fbo = self.ctx.simple_framebuffer(size, components=4)
+        pixels = self.render_area(fbo, size, (0, 0))
+        fbo.release()
+        return pixels
+
+    def render_tiled(
+        self, writer: ImageWriter,
+        origin: tuple[float, float] = (0, 0), scale: float = DEFAULT_SCALE,
+        style: int = DEFAULT_STYLE, K: tuple[float, float, float, float] = DEFAULT_K,
+        t: float = 0, tile_size: tuple[int, int] = DEFAULT_TILE_SIZE,
+        parameters: tuple[complex, ...] = DEFAULT_PARAMETERS
+    ):
+        # Renders an image of the size of the writer tile by tile,
+        # only one band of tiles is kept in memory before being written.
+        self.set_uniforms(origin, scale, style, K, t, parameters)
+
+        width, height = writer.width, writer.height
+        max_size = min(self.ctx.info["GL_MAX_VIEWPORT_DIMS"] + (self.ctx.info["GL_MAX_RENDERBUFFER_SIZE"],))
+        tile_width = min(tile_size[0], width, max_size)
+        tile_height = min(tile_size[1], height, max_size)
+
+        fbo = self.ctx.simple_framebuffer((tile_width, tile_height), components=4)
+        band = np.empty((tile_height, width, 4), dtype=np.uint8)
+
+        for y in range(0, height, tile_height):
+            h = min(tile_height, height - y)
+            for x in range(0, width, tile_width):
+                w = min(tile_width, width - x)
+                # center of the tile relative to the center of the image, y going up
+                offset = (x + w/2 - width/2, height/2 - y - h/2)
+                band[:h, x:x+w] = self.render_area(fbo, (w, h), offset)
+            writer.write_rows(band[:h])
+
+        fbo.release()
+
+    def release(self):
+        self.programs.release()
+        self.bytecode_buffer.release()
+        self.okhsl_table.release()
+        self.ctx.release()
+
+
+def create_standalone_context(backend: str | None = None) -> moderngl.Context:
+    if backend is not None:
+        return moderngl.create_standalone_context(require=450, backend=backend)
+
+    try:
+        return moderngl.create_standalone_context(require=450)
+    except Exception:
+        # no display available, EGL works with software renderers like llvmpipe
+        return moderngl.create_standalone_context(require=450, backend="egl")
+
+
+def main():
+    arg_parser = ArgumentParser(description="Render a complex function to an image without opening any window.")
+    arg_parser.add_argument("expression", help="expression of f(z), e.g. \"z^5 - 1\"")
+    arg_parser.add_argument("-o", "--output", default="render.png",
+        help="output file, written as PNG (.png), TIFF (.tif, .tiff), numpy array (.npy) or raw RGBA bytes (top row first)")
+    arg_parser.add_argument("--size", type=int, nargs=2, default=(1920, 1080), metavar=("WIDTH", "HEIGHT"))
+    arg_parser.add_argument("--origin", type=float, nargs=2, default=(0, 0), metavar=("RE", "IM"),
+        help="point of the complex plane at the center of the image")
+    arg_parser.add_argument("--scale", type=float, default=DEFAULT_SCALE, help="pixels per unit")
+    arg_parser.add_argument("--style", type=int, default=DEFAULT_STYLE,
+        help="style bitfield: colormap (bits 0-1), arg as hue (bit 2), modulus as luminosity (bit 3), style lines (bits 4-7)")
+    arg_parser.add_argument("--K", type=float, nargs=4, default=DEFAULT_K, help="spacing of the 4 style lines")
+    arg_parser.add_argument("-t", "--time", type=float, default=0, help="value of t (in seconds)")
+    arg_parser.add_argument("-p", "--param", nargs=3, action="append", default=[], metavar=("NAME", "RE", "IM"),
+        help=f"value of a parameter ({", ".join(PARAMS)}), 0 by default, can be repeated")
+    arg_parser.add_argument("--tile", type=int, nargs=2, default=DEFAULT_TILE_SIZE, metavar=("WIDTH", "HEIGHT"),
+        help="size of the rendered tiles, memory use is about 4 * image width * tile height bytes")
+    arg_parser.add_argument("--engine", choices=list(ENGINES), default="glsl",
+        help="evaluation of f: shader specialized for the expression (glsl) or bytecode interpreter (bytecode)")
+    arg_parser.add_argument("--fast-math", action="store_true",
+        help="faster and less precise complex functions (see accuracy.py)")
+    arg_parser.add_argument("--backend", default=None, help="moderngl context backend (e.g. egl)")
+    args = arg_parser.parse_args()
+
+    read_defined_functions()
+
+    parameters = list(DEFAULT_PARAMETERS)
+    for name, re, im in args.param:
+        if name not in PARAMS:
+            arg_parser.error(f"unknown parameter {name}, parameters are {", ".join(PARAMS)}")
+        parameters[PARAMS[name].index] = complex(float(re), float(im))
+
+    renderer = HeadlessRenderer(args.backend)
+    renderer.load_expression(args.expression, args.engine, args.fast_math)
+    with open_writer(args.output, *args.size) as writer:
+        renderer.render_tiled(
+            writer, tuple(args.origin), args.scale, args.style, args.K, args.time, tuple(args.tile), tuple(parameters)
+        )
+    renderer.release()
+
+
+if __name__ == '__main__':
+    main()
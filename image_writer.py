@@ -0,0 +1,193 @@
+from abc import ABC, abstractmethod
+from math import ceil
+from struct import pack
+from zlib import compressobj, crc32
+
+import numpy as np
+
+# Streaming image writers: rows are written from the top as they are rendered,
+# so that images much larger than the memory can be saved.
+
+TIFF_STRIP_SIZE = 1 << 16   # bytes per strip (at least one row)
+TIFF_TYPES = {3: "H", 4: "I", 16: "Q"}  # SHORT, LONG, LONG8
+
+
+class ImageWriter(ABC):
+    def __init__(self, width: int, height: int) -> None:
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+
+    def write_rows(self, rows: np.ndarray):
+        # rows is a (n, width, 4) uint8 RGBA array
+        if rows.shape[1:] != (self.width, 4):
+            raise Exception(f"Rows of shape {rows.shape[1:]} do not fit in a {self.width} pixels wide RGBA image")
+        if self.rows_written + len(rows) > self.height:
+            raise Exception("Too many rows written")
+        self._write_rows(rows)
+        self.rows_written += len(rows)
+
+    @abstractmethod
+    def _write_rows(self, rows: np.ndarray):
+        pass
+
+    def _finish(self):
+        # writes the end of the format once all rows are written
+        pass
+
+    @abstractmethod
+    def _release(self):
+        # closes the file, complete or not
+        pass
+
+    def close(self):
+        try:
+            if self.rows_written != self.height:
+                raise Exception(f"Image closed after {self.rows_written} of {self.height} rows")
+            self._finish()
+        finally:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            # the render failed: the file is only released, without checking the rows nor ending it as a valid image
+            self._release()
+
+
+class PNGWriter(ImageWriter):
+    def __init__(self, file_name: str, width: int, height: int) -> None:
+        super().__init__(width, height)
+        self.file = open(file_name, "wb")
+        self.file.write(b"\x89PNG\r\n\x1a\n")
+        # 8 bits per channel, color type 6 (RGBA)
+        self.write_chunk(b"IHDR", pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0))
+        self.compressor = compressobj(6)
+
+    def write_chunk(self, chunk_type: bytes, data: bytes):
+        self.file.write(pack(">I", len(data)) + chunk_type + data + pack(">I", crc32(chunk_type + data)))
+
+    def _write_rows(self, rows: np.ndarray):
+        # every scanline starts with its filter type (0: None)
+        scanlines = np.zeros((len(rows), 1 + 4 * self.width), dtype=np.uint8)
+        scanlines[:, 1:] = rows.reshape(len(rows), 4 * self.width)
+        data = self.compressor.compress(scanlines.tobytes())
+        if data:
+            self.write_chunk(b"IDAT", data)
+
+    def _finish(self):
+        self.write_chunk(b"IDAT", self.compressor.flush())
+        self.write_chunk(b"IEND", b"")
+
+    def _release(self):
+        self.file.close()
+
+
+class TIFFWriter(ImageWriter):
+    # Uncompressed RGBA TIFF, written as a BigTIFF when the file would not fit in 4 GB.
+    # Pixel data comes first, the tags are written at the end once all strips are known.
+
+    def __init__(self, file_name: str, width: int, height: int) -> None:
+        super().__init__(width, height)
+        self.big = self.classic_size() >= 1 << 32
+        self.file = open(file_name, "wb")
+        if self.big:
+            self.file.write(b"II" + pack("<HHHQ", 43, 8, 0, 0))
+        else:
+            self.file.write(b"II" + pack("<HI", 42, 0))
+        self.data_start = self.file.tell()
+
+    def _write_rows(self, rows: np.ndarray):
+        self.file.write(np.ascontiguousarray(rows).tobytes())
+
+    def _finish(self):
+        self.write_ifd()
+
+    def _release(self):
+        self.file.close()
+
+    def rows_per_strip(self) -> int:
+        return max(1, TIFF_STRIP_SIZE // (4 * self.width))
+
+    def classic_size(self) -> int:
+        # Size of the file as a classic TIFF (32 bits offsets), at most: header, pixels, then what write_ifd adds:
+        # BitsPerSample, StripOffsets and StripByteCounts values and the IFD (11 entries).
+        n_strips = ceil(self.height / self.rows_per_strip())
+        return 8 + 4 * self.width * self.height + 8 + 2 * 4 * n_strips + 2 + 11 * 12 + 4
+
+    def write_ifd(self):
+        row_size = 4 * self.width
+        rows_per_strip = self.rows_per_strip()
+        strip_starts = range(0, self.height, rows_per_strip)
+        offsets = [self.data_start + row * row_size for row in strip_starts]
+        counts = [min(rows_per_strip, self.height - row) * row_size for row in strip_starts]
+
+        offset_type = 16 if self.big else 4
+        entries = [
+            (256, 4, [self.width]),         # ImageWidth
+            (257, 4, [self.height]),        # ImageLength
+            (258, 3, [8, 8, 8, 8]),         # BitsPerSample
+            (259, 3, [1]),                  # Compression: none
+            (262, 3, [2]),                  # PhotometricInterpretation: RGB
+            (273, offset_type, offsets),    # StripOffsets
+            (277, 3, [4]),                  # SamplesPerPixel
+            (278, 4, [rows_per_strip]),     # RowsPerStrip
+            (279, offset_type, counts),     # StripByteCounts
+            (284, 3, [1]),                  # PlanarConfiguration: chunky
+            (338, 3, [2]),                  # ExtraSamples: unassociated alpha
+        ]
+
+        offset_fmt = "<Q" if self.big else "<I"
+        inline_size = 8 if self.big else 4
+
+        ifd = pack("<Q" if self.big else "<H", len(entries))
+        for tag, type_, values in entries:
+            data = pack(f"<{len(values)}{TIFF_TYPES[type_]}", *values)
+            if len(data) <= inline_size:
+                value = data.ljust(inline_size, b"\0")
+            else:
+                # values that do not fit in the entry are written before the IFD
+                value = pack(offset_fmt, self.file.tell())
+                self.file.write(data)
+            ifd += pack("<HHQ" if self.big else "<HHI", tag, type_, len(values)) + value
+        ifd += pack(offset_fmt, 0)  # no next IFD
+
+        ifd_offset = self.file.tell()
+        self.file.write(ifd)
+        self.file.seek(8 if self.big else 4)
+        self.file.write(pack(offset_fmt, ifd_offset))
+
+
+class MemmapWriter(ImageWriter):
+    # Raw RGBA bytes (top row first), or a numpy .npy file, written through a memory map
+
+    def __init__(self, file_name: str, width: int, height: int) -> None:
+        super().__init__(width, height)
+        shape = (height, width, 4)
+        if file_name.lower().endswith(".npy"):
+            self.pixels = np.lib.format.open_memmap(file_name, mode="w+", dtype=np.uint8, shape=shape)
+        else:
+            self.pixels = np.memmap(file_name, dtype=np.uint8, mode="w+", shape=shape)
+
+    def _write_rows(self, rows: np.ndarray):
+        self.pixels[self.rows_written:self.rows_written + len(rows)] = rows
+        # written pages can be dropped from memory
+        self.pixels.flush()
+
+    def _release(self):
+        self.pixels.flush()
+        del self.pixels
+
+
+def open_writer(file_name: str, width: int, height: int) -> ImageWriter:
+    # The format is chosen from the extension, raw RGBA bytes by default
+    extension = file_name.lower().rsplit(".", 1)[-1]
+    if extension == "png":
+        return PNGWriter(file_name, width, height)
+    if extension in ("tif", "tiff"):
+        return TIFFWriter(file_name, width, height)
+    return MemmapWriter(file_name, width, height)
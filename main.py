@@ -1,11 +1,35 @@
 from __future__ import annotations
 
-from PyQt5.QtWidgets import QApplication
+from timings import startup
 
-from settings_window import SettingsWindow
+with startup.phase("Qt import"):
+    from PyQt5.QtWidgets import QApplication
+
+with startup.phase("Windows import"):
+    from settings_window import SettingsWindow
+
+with startup.phase("Saved functions"):
+    from expression_parser.functions import read_defined_functions
+    read_defined_functions()
 
 if __name__ == '__main__':
     app = QApplication([])
-    settings = SettingsWindow()
-    settings.show()
+    with startup.phase("Windows setup"):
+        settings = SettingsWindow()
+        settings.show()
+
+    # The report is printed once the first frame is shown and the LateX renderer is loaded
+    pending = {"First frame", "LaTeX renderer"}
+
+    def startup_done(name: str):
+        if name not in pending:
+            return
+        pending.remove(name)
+        if name == "First frame":
+            startup.mark(name)
+        if not pending:
+            print(startup.report())
+
+    settings.openGL_widget.frameSwapped.connect(lambda: startup_done("First frame"))
+    settings.tex_preview.loaded.connect(lambda: startup_done("LaTeX renderer"))
     app.exec_()
\ No newline at end of file
@@ -1,18 +1,28 @@
-from array import array
+from math import ceil, log2, sqrt
+from time import perf_counter
 from traceback import format_exc
 
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QtCore import QSize, QTimer, QDateTime, Qt
+from PyQt5.QtCore import QSize, QTimer, QDateTime, Qt, pyqtSignal
 
+import numpy as np
 import moderngl
 
-from expression_parser.main import parse_expression, simplify_tree
+from shader_builder import QUAD_VERTICES, BytecodeBuffer, OkhslTable, ProgramCache, RenderTarget, shader_defines, write_complex_array
+from compilation import Compilation, compile_expression
+from cpu_renderer import CpuRenderer
+from expression_parser.hoisting import evaluate
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
     from settings_window import SettingsWindow
 
+PREVIEW_FACTOR = 4          # pixels of the view per pixel of the previews rendered while the view moves, in each direction
+PREVIEW_IDLE_DELAY = 200    # ms without moving the view before rendering at full resolution
+MAX_PIXEL_SIZE = 8          # coarsest resolution of the dynamic resolution, in pixels of the view per rendered pixel
+PIXEL_SIZE_STEPS = 4        # pixel sizes of the dynamic resolution per factor 2
+
 
 class RenderWindow(QMainWindow):
     def __init__(self):
@@ -22,7 +32,8 @@ class RenderWindow(QMainWindow):
         # Prevents closing to pair the windows
         self.setWindowFlag(Qt.WindowCloseButtonHint, False)
 
-        self.render_widget = RenderWidget()
+        # the shaders need OpenGL 4.5, f is rendered on the CPU without it
+        self.render_widget = RenderWidget() if opengl_available() else CpuRenderWidget()
         self.setCentralWidget(self.render_widget)
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
@@ -34,95 +45,267 @@ class RenderWindow(QMainWindow):
         return super().keyPressEvent(event)
 
 
-class RenderWidget(QOpenGLWidget):
+def opengl_available() -> bool:
+    # whether the context of QOpenGLWidget (default format) supports the version required by moderngl in RenderWidget
+    context = QOpenGLContext()
+    context.setFormat(QSurfaceFormat.defaultFormat())
+    return context.create() and context.format().version() >= (4, 5)
+
+
+class ResolutionScaler:
+    # Dynamic resolution: feedback loop keeping the frame time within a budget by changing the size of the rendered pixels.
+    # The time of a frame is assumed proportional to the number of rendered pixels, a frame measured at a pixel size p
+    # gives the time at full resolution (time * p^2) and the pixel size meeting the budget (sqrt(full time / budget)).
+
     def __init__(self) -> None:
+        self.estimate = 1.0     # pixel size meeting the budget, smoothed over the last frames
+
+    def measure(self, frame_time: float, pixel_size: float, budget: float):
+        # frame_time and budget in ms
+        target = sqrt(frame_time / budget) * pixel_size
+        # halfway towards the target (geometrically), damps the noise of the measures
+        self.estimate = min(max(sqrt(self.estimate * target), 1), MAX_PIXEL_SIZE)
+
+    def pixel_size(self) -> float:
+        # quantized, the offscreen framebuffer is only recreated when the step changes.
+        # Never below 1: supersampling needs a whole number of samples per pixel and is only done for still frames.
+        return 2 ** (round(log2(self.estimate) * PIXEL_SIZE_STEPS) / PIXEL_SIZE_STEPS)
+
+
+class RenderView:
+    # Animation timer, expression loading and mouse controls shared by the render widgets (mixed in before the Qt widget class).
+    # Subclasses define load_compilation(compilation), called by load_shader_code and raising if it can not be rendered,
+    # and draw the frames.
+
+    def init_view(self):
         self.move_start = None
         self.settings: SettingsWindow = None
-        super().__init__()
+        # Animation timer, only running when the expression depends on t,
+        # other frames are rendered on demand when settings change.
         self.timer = QTimer(self)
         self.timer.setInterval(50)
-        self.timer.start()
         self.timer.timeout.connect(self.update)
+        # While the view is dragged or zoomed with the mouse, frames are rendered at a lower resolution and upscaled,
+        # so that they keep up with the mouse however long f takes. The full resolution frame follows once the view stops.
+        self.moving = False
+        self.idle_timer = QTimer(self)
+        self.idle_timer.setSingleShot(True)
+        self.idle_timer.setInterval(PREVIEW_IDLE_DELAY)
+        self.idle_timer.timeout.connect(self.stop_moving)
+        # With a frame time budget, animations get the resolution meeting it, and previews when it is coarser
+        self.scaler = ResolutionScaler()
 
-    def load_shader_code(self):
-        with open("vertex_shader.glsl") as f:
-            vertex_code = f.read()
+    def set_max_fps(self, fps: int):
+        self.timer.setInterval(round(1000 / fps))
+
+    def view_moved(self):
+        self.moving = True
+        self.idle_timer.start()     # restarts the delay
+
+    def stop_moving(self):
+        self.moving = False
+        self.update()
+
+    def pixel_size(self) -> float:
+        # size of the rendered pixels in pixels of the view.
+        # Moving views are previews, coarser when the frame time budget needs it,
+        # animations get the resolution meeting the budget and still frames the full one.
+        if self.moving:
+            return max(PREVIEW_FACTOR, self.scaler.pixel_size() if self.adaptive() else 1)
+        if self.adaptive():
+            return self.scaler.pixel_size()
+        return 1 / self.settings.get_supersampling()
+
+    def adaptive(self) -> bool:
+        # whether the frames have the dynamic resolution, only these are timed
+        return bool(self.settings.get_frame_budget()) and (self.moving or self.timer.isActive())
 
-        expression = self.settings.expression_line.text()
+    def frame_rendered(self, frame_time: float, pixel_size: float):
+        # time of a frame in ms, rendered at pixel_size
+        budget = self.settings.get_frame_budget()
+        if budget:
+            self.scaler.measure(frame_time, pixel_size, budget)
+
+    def load_shader_code(self):
+        compilation = compile_expression(self.settings.expression_line.text())
         try:
-            tree = parse_expression(expression)
-            glsl_expression = simplify_tree(tree).glsl()
+            self.load_compilation(compilation)
         except Exception as e:
             self.settings.error_log.setText(str(e))
             print(format_exc())
             return 1
         
         self.settings.error_log.setText("All good!")
+        # where the time went, stages already done for this text (e.g. by the LateX preview) are not run again
+        self.settings.error_log.setToolTip(compilation.timings.report())
 
-        fragment_code = ""
-        dir_ = "fragment_shader/"
-        with open(dir_+"header.glsl") as f:
-            fragment_code += f.read()
-        with open(dir_+"colormap.glsl") as f:
-            fragment_code += f.read()
-        with open(dir_+"complex.glsl") as f:
-            fragment_code += f.read()
-        with open(dir_+"shader.glsl") as f:
-            fragment_code += f.read().replace("FUNCTION", glsl_expression)
-
-        self.program = self.ctx.program(vertex_shader=vertex_code, fragment_shader=fragment_code)
-        self.render_object = self.ctx.vertex_array(self.program, [(self.quad_buffer, '2f 2f', 'vert', 'texcoord')])
-        
         # reset timer for consistency
         self.start = QDateTime.currentMSecsSinceEpoch()
+        if compilation.uses_time:
+            self.timer.start()
+        else:
+            self.timer.stop()
         return 0
 
+    def wheelEvent(self, event: QWheelEvent):
+        self.view_moved()
+        self.settings.change_scale(event.angleDelta().y()//120)
+
+    def mousePressEvent(self, event: QMouseEvent) -> None:
+        if event.buttons() & 1:
+            self.move_start = event.localPos()
+        return super().mousePressEvent(event)
+    
+    def mouseMoveEvent(self, event: QMouseEvent) -> None:
+        if self.move_start is not None:
+            self.view_moved()
+            self.settings.move(event.localPos() - self.move_start)
+            self.move_start = event.localPos()
+        return super().mouseMoveEvent(event)
+    
+    def mouseReleaseEvent(self, event: QMouseEvent) -> None:
+        if event.button() == 1:
+            if self.move_start is not None:
+                self.settings.move(event.localPos() - self.move_start)
+                self.move_start = None
+        return super().mouseReleaseEvent(event)
+
+
+class RenderWidget(RenderView, QOpenGLWidget):
+    def __init__(self) -> None:
+        super().__init__()
+        self.init_view()
+
+    def load_compilation(self, compilation: Compilation):
+        self.load_program(compilation, shader_defines(self.settings.get_style(), self.settings.get_fast_math()))
+        self.hoisted = compilation.hoisted[1]
+
+    def load_program(self, compilation: Compilation, defines: dict[str, int]):
+        # the style is compiled in the shader, changing it swaps the program
+        self.program, self.render_object = compilation.program(
+            self.settings.get_engine(), defines, self.programs, self.bytecode_buffer
+        )
+        self.compilation, self.defines = compilation, defines
+
     def initializeGL(self):
         self.ctx = moderngl.create_context(require=450)
-        self.quad_buffer = self.ctx.buffer(data=array('f', [
-            # position (x, y), uv coords (x, y)
-            -1.0, 1.0, -1.0, 1.0,   # topleft
-            1.0, 1.0, 1.0, 1.0,     # topright
-            -1.0, -1.0, -1.0, -1.0, # bottomleft
-            1.0, -1.0, 1.0, -1.0,   # bottomright
-        ]))
+        self.quad_buffer = self.ctx.buffer(data=QUAD_VERTICES)
+        self.programs = ProgramCache(self.ctx, self.quad_buffer)
+        self.bytecode_buffer = BytecodeBuffer(self.ctx)
+        self.okhsl_table = OkhslTable(self.ctx)
+        self.target = RenderTarget(self.ctx, self.quad_buffer)
+        self.query = self.ctx.query(time=True)
+        self.timed_frame = None     # pixel size of the frame timed by the query, None when the query has no result to read
 
         exit_code = self.load_shader_code()
         if exit_code:
             raise Exception("Error while parsing expression or compiling shader code.")
 
     def paintGL(self):
+        defines = shader_defines(self.settings.get_style(), self.settings.get_fast_math())
+        if defines != self.defines:
+            self.load_program(self.compilation, defines)   # compiled once, then taken from the cache
+
         params = {}
         params["origin"] = self.settings.get_origin()
         params["size"] = (self.size().width(), self.size().height())
         params["scale"] = self.settings.get_scale()
-        params["style"] = self.settings.get_style()
         params["K"] = self.settings.get_Ks()
         t = QDateTime.currentMSecsSinceEpoch() - self.start
         params["t_real"] = t % 4294967296 # modulo max uint
         for key, value in params.items():
             if key in self.program:
                 self.program[key] = value
+        parameters = self.settings.get_params()
+        write_complex_array(self.program, "params", parameters)
+        # subexpressions of f not depending on z, with the same t as the shader
+        t = complex(params["t_real"] / 1000)
+        write_complex_array(self.program, "hoisted", [evaluate(node, t, parameters) for node in self.hoisted])
     
+        self.bytecode_buffer.use()
+        self.okhsl_table.use()
+        # GPU time of the frames for the dynamic resolution. The result of a frame is read at the next one:
+        # the GPU is done with it by then, reading it right after drawing would wait for the GPU every frame.
+        if self.timed_frame is not None:
+            self.frame_rendered(self.query.elapsed / 1e6, self.timed_frame)
+            self.timed_frame = None
+        pixel_size = self.pixel_size()
+        if not self.adaptive():
+            self.draw(pixel_size)
+            return
+        with self.query:
+            self.draw(pixel_size)
+        self.timed_frame = pixel_size
+
+    def draw(self, pixel_size: float):
+        if pixel_size == 1:
+            self.render_object.render(mode=moderngl.TRIANGLE_STRIP)
+            return
+
+        # previews and supersampled frames are rendered offscreen and drawn on the widget's framebuffer
+        screen = self.ctx.detect_framebuffer(self.defaultFramebufferObject())
+        width, height = screen.size
+        self.target.use((ceil(width / pixel_size), ceil(height / pixel_size)))
         self.render_object.render(mode=moderngl.TRIANGLE_STRIP)
-        
-    def wheelEvent(self, event: QWheelEvent):
-        self.settings.change_scale(event.angleDelta().y()//120)
+        screen.use()
+        self.target.draw()
 
-    def mousePressEvent(self, event: QMouseEvent) -> None:
-        if event.buttons() & 1:
-            self.move_start = event.localPos()
-        return super().mousePressEvent(event)
-    
-    def mouseMoveEvent(self, event: QMouseEvent) -> None:
-        if self.move_start is not None:
-            self.settings.move(event.localPos() - self.move_start)
-            self.move_start = event.localPos()
-        return super().mouseMoveEvent(event)
-    
-    def mouseReleaseEvent(self, event: QMouseEvent) -> None:
-        if event.button() == 1:
-            if self.move_start is not None:
-                self.settings.move(event.localPos() - self.move_start)
-                self.move_start = None
-        return super().mouseReleaseEvent(event)
\ No newline at end of file
+
+class CpuRenderWidget(RenderView, QWidget):
+    # Renders with cpu_renderer when OpenGL 4.5 is not available,
+    # the frames are drawn in a buffer shown by Qt (the engine and fast math settings do not apply)
+
+    frameSwapped = pyqtSignal()     # like QOpenGLWidget, emitted once a frame is shown
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.init_view()
+        self.renderer = CpuRenderer()
+        self.function = None
+        self.pixels = np.zeros((0, 0, 4), dtype=np.uint8)
+
+    def load_compilation(self, compilation: Compilation):
+        self.function = compilation.numpy
+
+    def showEvent(self, event: QShowEvent):
+        # like initializeGL, the expression is loaded when the widget is first shown
+        if self.function is None:
+            self.load_shader_code()
+        return super().showEvent(event)
+
+    def paintEvent(self, event: QPaintEvent):
+        if self.function is None:
+            return
+
+        pixel_size = self.pixel_size()
+        width, height = ceil(self.width() / pixel_size), ceil(self.height() / pixel_size)
+        if self.pixels.shape[:2] != (height, width):
+            self.pixels = np.empty((height, width, 4), dtype=np.uint8)
+
+        t = (QDateTime.currentMSecsSinceEpoch() - self.start) / 1000
+        start = perf_counter()
+        self.renderer.render(
+            self.function, self.pixels, self.settings.get_origin(), self.settings.get_scale(),
+            self.settings.get_style(), self.settings.get_Ks(), t, self.settings.get_params(), pixel_size=pixel_size
+        )
+        if self.adaptive():
+            self.frame_rendered((perf_counter() - start) * 1000, pixel_size)
+
+        frame = self.pixels
+        if pixel_size < 1:
+            # average of the samples of each pixel
+            samples = round(1 / pixel_size)
+            frame = np.rint(frame.reshape(height // samples, samples, width // samples, samples, 4).mean(axis=(1, 3))).astype(np.uint8)
+        height, width, _ = frame.shape
+
+        # the image is a view of the buffer, the alpha of the nan checkerboard is ignored like on screen with OpenGL
+        image = QImage(frame.data, width, height, 4 * width, QImage.Format_RGBX8888)
+        painter = QPainter(self)
+        painter.setRenderHint(QPainter.SmoothPixmapTransform)   # previews are upscaled
+        painter.drawImage(self.rect(), image)
+        painter.end()
+        self.frameSwapped.emit()
+
+    def closeEvent(self, event: QCloseEvent) -> None:
+        self.renderer.release()
+        return super().closeEvent(event)
\ No newline at end of file
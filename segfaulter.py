@@ -1,4 +0,0 @@
-# Throws a segfault on some systems, used to activate an option
-
-from matplotlib.pyplot import draw
-draw()
\ No newline at end of file
@@ -1,24 +1,20 @@
 from PyQt5.QtWidgets import *
 from PyQt5.QtGui import *
-from PyQt5.QtCore import QPointF, Qt, QSize
+from PyQt5.QtCore import QObject, QPointF, QPoint, Qt, QSize, QEvent
 
 from render_window import RenderWindow
+from shader_builder import ENGINES
 
-print("Setting up LateX renderer...")
-from tex_renderer import render_tex
-print("LateX renderer ready!")
+from tex_preview import TexPreview
 
 from expression_parser.lexer import VARS, CONSTS, FUNCS, DEF_FUNCS
-from expression_parser.main import parse_expression
-
-print("Importing saved functions...")
-from expression_parser.functions import read_defined_functions
-read_defined_functions()
-print("Saved functions imported!")
+from compilation import compile_expression
+from expression_parser.parameters import PARAMS
 
 COLORMAPS = [
     {"name": "HSL",   "desc": "Common Hue Saturation Luminosity colormap."},
-    {"name": "OKHSL", "desc": "HSL colormap with a more consistent perceived lightness."}
+    {"name": "OKHSL", "desc": "HSL colormap with a more consistent perceived lightness."},
+    {"name": "OKHSL (fast)", "desc": "OKHSL colormap read from a precomputed table, faster with slightly less accurate colors."}
 ]
 
 STYLELINES = [
@@ -28,6 +24,10 @@ STYLELINES = [
     {"name": "arg(f(z))", "defK": 179, "minK": 5,    "maxK": 180, "map": lambda x: 185 - x},
 ]
 
+# Parameter sliders go from -PARAM_RANGE to PARAM_RANGE with steps of 1/PARAM_STEPS
+PARAM_RANGE = 10
+PARAM_STEPS = 100
+
 
 class SettingsWindow(QMainWindow):
 
@@ -41,11 +41,15 @@ class SettingsWindow(QMainWindow):
 
         self.setWindowTitle("Settings")
 
+        self.tex_preview = TexPreview(self)
+        self.tooltip_preview = TexPreview(self, delay=0)
+
         # Layout is built from top to bottom, from left to right
 
         main_layout = QVBoxLayout()
 
         self.expression(main_layout)
+        self.parameters(main_layout)
         self.zoom_pos(main_layout)
         self.style_(main_layout)
 
@@ -74,6 +78,9 @@ class SettingsWindow(QMainWindow):
         self.reload_button.setAutoDefault(True)
         layout.addWidget(self.reload_button)
 
+        self.animation(layout)
+        self.engine(layout)
+
         self.error_log = QLineEdit("This is where error show up.")
         self.error_log.setReadOnly(True)
         layout.addWidget(self.error_log)
@@ -98,6 +105,63 @@ class SettingsWindow(QMainWindow):
         widget.setLayout(layout)
         parent_layout.addWidget(widget)
     
+    def animation(self, parent_layout: QLayout):
+        layout = QHBoxLayout()
+
+        layout.addWidget(QLabel("Animation frame rate cap (only when f depends on t) : "))
+
+        self.max_fps = QSpinBox()
+        self.max_fps.setRange(1, 240)
+        self.max_fps.setValue(20)
+        self.max_fps.setSuffix(" FPS")
+        layout.addWidget(self.max_fps)
+
+        # Dynamic resolution: animations and moving views are rendered at the resolution meeting this frame time
+        layout.addWidget(QLabel("Frame time budget : "))
+
+        self.frame_budget = QSpinBox()
+        self.frame_budget.setRange(0, 1000)
+        self.frame_budget.setValue(40)
+        self.frame_budget.setSuffix(" ms")
+        self.frame_budget.setSpecialValueText("Off")
+        self.frame_budget.setToolTip("Lowers the resolution of animations and moving views when frames take longer (Off: full resolution animations).")
+        layout.addWidget(self.frame_budget)
+
+        layout.addStretch()
+
+        widget = QWidget()
+        widget.setLayout(layout)
+        parent_layout.addWidget(widget)
+
+    def engine(self, parent_layout: QLayout):
+        layout = QHBoxLayout()
+
+        layout.addWidget(QLabel("Engine : "))
+
+        # The interpreter is compiled once, changing the expression is faster but rendering is slower
+        self.engine_list = QComboBox()
+        for key, name in ENGINES.items():
+            self.engine_list.addItem(name, key)
+        layout.addWidget(self.engine_list)
+
+        # Faster and less precise complex functions, see accuracy.py for their errors
+        self.fast_math = QCheckBox()
+        self.fast_math.setToolTip("Faster complex functions, errors up to about 2e-4 instead of 3e-5 (asin, acos), see accuracy.py.")
+        layout.addWidget(self.fast_math)
+        layout.addWidget(QLabel("Fast math"))
+
+        # While moving the view, previews are rendered at a lower resolution whatever this setting
+        self.supersampling = QCheckBox()
+        self.supersampling.setToolTip("Once the view stops moving, renders 2x2 samples per pixel (smoother, 4 times slower).")
+        layout.addWidget(self.supersampling)
+        layout.addWidget(QLabel("Supersampling"))
+
+        layout.addStretch()
+
+        widget = QWidget()
+        widget.setLayout(layout)
+        parent_layout.addWidget(widget)
+
     def exp_insert(self, parent_layout: QLayout):
         layout = QHBoxLayout()
 
@@ -105,7 +169,7 @@ class SettingsWindow(QMainWindow):
 
         self.insert_type = QComboBox()
         self.insert_type.addItems(
-            ["Variable", "Constant", "Built-in Function", "Custom Function"]
+            ["Variable", "Constant", "Parameter", "Built-in Function", "Custom Function"]
         )
         layout.addWidget(self.insert_type)
 
@@ -116,11 +180,14 @@ class SettingsWindow(QMainWindow):
         layout.addWidget(self.insert_name)
 
         # Displaying a raw icon (for tooltip):
-        label = QLabel()
+        self.insert_info = QLabel()
         icon = self.style().standardIcon(QStyle.SP_MessageBoxInformation)
-        label.setPixmap(icon.pixmap(QSize(16, 16)))
-        label.setToolTip("<img src=\"tooltip.png\">")
-        layout.addWidget(label)
+        self.insert_info.setPixmap(icon.pixmap(QSize(16, 16)))
+        self.insert_info.installEventFilter(self)
+        layout.addWidget(self.insert_info)
+
+        # The rendered description is shown in a tooltip-like popup (Qt tooltips only display text)
+        self.insert_tooltip = QLabel(self, Qt.ToolTip)
 
         layout.addStretch()
 
@@ -131,6 +198,43 @@ class SettingsWindow(QMainWindow):
         widget.setLayout(layout)
         parent_layout.addWidget(widget)
     
+    def parameters(self, parent_layout: QLayout):
+        parent_layout.addWidget(QLabel("Parameters (changing them does not reload the expression)"))
+
+        layout = QGridLayout()
+
+        layout.addWidget(QLabel("Real part"), 0, 1)
+        layout.addWidget(QLabel("Imaginary part"), 0, 2)
+
+        self.param_sliders: list[tuple[QSlider, QSlider]] = []
+        self.param_displays: list[QLabel] = []
+        self.param_resets: list[QPushButton] = []
+        for i, name in enumerate(PARAMS, start=1):
+            layout.addWidget(QLabel(f"{name} = "), i, 0)
+
+            sliders = []
+            for j in range(2):
+                slider = QSlider(Qt.Horizontal)
+                slider.setMinimum(-PARAM_RANGE * PARAM_STEPS)
+                slider.setMaximum(PARAM_RANGE * PARAM_STEPS)
+                slider.setValue(0)
+                layout.addWidget(slider, i, 1 + j)
+                sliders.append(slider)
+            self.param_sliders.append(tuple(sliders))
+
+            display = QLabel()
+            display.setMinimumWidth(120)
+            layout.addWidget(display, i, 3)
+            self.param_displays.append(display)
+
+            button = QPushButton("Reset")
+            layout.addWidget(button, i, 4)
+            self.param_resets.append(button)
+
+        widget = QGroupBox()
+        widget.setLayout(layout)
+        parent_layout.addWidget(widget)
+
     def zoom_pos(self, parent_layout: QLayout):
         parent_layout.addWidget(QLabel("Zoom and Position"))
         
@@ -273,11 +377,17 @@ class SettingsWindow(QMainWindow):
 
     def bind(self):
         self.expression_line.textChanged.connect(self.update_exp_tex_render)
+        self.tex_preview.ready.connect(self.update_exp_tex_label)
+        self.tooltip_preview.ready.connect(self.update_insert_tooltip)
         self.expression_line.returnPressed.connect(self.reload_expression)
         self.insert_type.currentIndexChanged.connect(self.update_insert_cb)
         self.insert_name.currentTextChanged.connect(self.update_insert_desc)
         self.insert.clicked.connect(self.apply_insert)
         self.reload_button.clicked.connect(self.reload_expression)
+        self.max_fps.valueChanged.connect(self.openGL_widget.set_max_fps)
+        self.engine_list.currentIndexChanged.connect(self.reload_expression)
+        self.fast_math.stateChanged.connect(self.refresh)
+        self.supersampling.stateChanged.connect(self.refresh)
         self.pos_x.returnPressed.connect(self.refresh)
         self.pos_y.returnPressed.connect(self.refresh)
         self.scale.valueChanged.connect(self.refresh)
@@ -285,6 +395,10 @@ class SettingsWindow(QMainWindow):
         self.colormap_list.currentIndexChanged.connect(self.refresh)
         self.arg_hue.stateChanged.connect(self.refresh)
         self.mod_lum.stateChanged.connect(self.refresh)
+        for i in range(len(PARAMS)):
+            for slider in self.param_sliders[i]:
+                slider.valueChanged.connect(self.refresh)
+            self.param_resets[i].clicked.connect(lambda state, x=i: self.reset_param(x))
         for i in range(4):
             self.style_lines_checkboxes[i].stateChanged.connect(self.refresh)
             self.style_lines_sliders[i].valueChanged.connect(self.refresh)
@@ -299,6 +413,11 @@ class SettingsWindow(QMainWindow):
         self.scale.setValue(22)
         self.refresh()
     
+    def reset_param(self, i: int):
+        for slider in self.param_sliders[i]:
+            slider.setValue(0)
+        self.refresh()
+
     def reset_style_line(self, i: int):
         self.style_lines_sliders[i].setValue(STYLELINES[i]["defK"])
         self.refresh()
@@ -312,6 +431,20 @@ class SettingsWindow(QMainWindow):
     def get_scale(self) -> float:
         return 10 ** (self.scale.value()/10)
     
+    def get_engine(self) -> str:
+        return self.engine_list.currentData()
+
+    def get_fast_math(self) -> bool:
+        return self.fast_math.isChecked()
+
+    def get_frame_budget(self) -> int:
+        # ms, 0 without dynamic resolution
+        return self.frame_budget.value()
+
+    def get_supersampling(self) -> int:
+        # samples per pixel in each direction
+        return 2 if self.supersampling.isChecked() else 1
+
     def get_style(self) -> int:
         res = self.colormap_list.currentIndex()
         res |= 4 * self.arg_hue.isChecked()
@@ -320,6 +453,12 @@ class SettingsWindow(QMainWindow):
             res |= (1 << (4+i)) * self.style_lines_checkboxes[i].isChecked()
         return res
     
+    def get_params(self) -> list[complex]:
+        return [
+            complex(re.value(), im.value()) / PARAM_STEPS
+            for re, im in self.param_sliders
+        ]
+
     def get_Ks(self) -> int:
         return (
             STYLELINES[i]["map"](self.style_lines_sliders[i].value())
@@ -343,17 +482,16 @@ class SettingsWindow(QMainWindow):
     # UPDATERS ======================================================================================================
 
     def update_exp_tex_render(self):
-        text = self.expression_line.text()
+        # the compilation is kept, the tree is not parsed again when reloading the expression
         try:
-            tree = parse_expression(text)
+            latex = compile_expression(self.expression_line.text()).latex
         except Exception as e:
             return
         
-        if tree is None: return
-        
-        name = "fz.png"
-        render_tex(f"${tree.tex()}$", name, size=20)
-        pixmap = QPixmap(name)
+        # rendered in the background, see update_exp_tex_label
+        self.tex_preview.request(latex, 20)
+
+    def update_exp_tex_label(self, pixmap: QPixmap):
         self.tex_label.setPixmap(pixmap)
 
     def update_insert_cb(self):
@@ -364,6 +502,8 @@ class SettingsWindow(QMainWindow):
                 self.insert_name.addItems(VARS.keys())
             case "Constant":
                 self.insert_name.addItems(CONSTS.keys())
+            case "Parameter":
+                self.insert_name.addItems(PARAMS.keys())
             case "Built-in Function":
                 self.insert_name.addItems(sorted(FUNCS.keys()))
             case "Custom Function":
@@ -381,12 +521,18 @@ class SettingsWindow(QMainWindow):
                     desc = VARS[name].desc
                 case "Constant":
                     desc = CONSTS[name].desc
+                case "Parameter":
+                    desc = PARAMS[name].desc
                 case "Built-in Function":
                     desc = FUNCS[name].__doc__
                 case "Custom Function":
                     desc = f"${name}(z) = {DEF_FUNCS[name].tex()}$"
         
-        render_tex(desc, "tooltip.png")
+        self.tooltip_preview.request(desc, 12)
+
+    def update_insert_tooltip(self, pixmap: QPixmap):
+        self.insert_tooltip.setPixmap(pixmap)
+        self.insert_tooltip.adjustSize()
     
     def apply_insert(self):
 
@@ -394,7 +540,7 @@ class SettingsWindow(QMainWindow):
         exp = self.expression_line.text()
 
         match (self.insert_type.currentText()):
-            case "Variable" | "Constant":
+            case "Variable" | "Constant" | "Parameter":
                 text = self.insert_name.currentText()
             case "Built-in Function" | "Custom Function":
                 text = self.insert_name.currentText() + "()"
@@ -402,6 +548,10 @@ class SettingsWindow(QMainWindow):
         self.expression_line.setText(exp[:pos] + text + exp[pos:])
         self.expression_line.setFocus()
     
+    def update_param_displays(self):
+        for display, value in zip(self.param_displays, self.get_params()):
+            display.setText(f"{value.real:.2f} {"-" if value.imag < 0 else "+"} {abs(value.imag):.2f}i")
+
     def update_scale_display(self):
         self.scale_display.setText("{:.3e}".format(self.get_scale()))
     
@@ -413,6 +563,7 @@ class SettingsWindow(QMainWindow):
         self.refresh()
     
     def refresh(self):
+        self.update_param_displays()
         self.update_colormap_desc()
         self.update_scale_display()
         self.openGL_widget.update()
@@ -423,9 +574,24 @@ class SettingsWindow(QMainWindow):
     def show(self) -> None:
         # Opens both windows
         self.render_window.showMaximized()
-        return super().show()
+        super().show()
+        # matplotlib is only needed for LateX previews, it is loaded once the windows are up
+        self.tex_preview.load()
     
     def closeEvent(self, event: QCloseEvent) -> None:
         # Closes both windows
         self.render_window.close()
-        return super().closeEvent(event)
\ No newline at end of file
+        self.tex_preview.stop()
+        self.tooltip_preview.stop()
+        return super().closeEvent(event)
+
+    def eventFilter(self, obj: QObject, event: QEvent) -> bool:
+        # Shows the rendered description of the selected insert when hovering the info icon
+        if obj is self.insert_info:
+            if event.type() == QEvent.ToolTip:
+                self.insert_tooltip.move(event.globalPos() + QPoint(16, 16))
+                self.insert_tooltip.show()
+                return True
+            if event.type() == QEvent.Leave:
+                self.insert_tooltip.hide()
+        return super().eventFilter(obj, event)
\ No newline at end of file
@@ -0,0 +1,116 @@
+import re
+from dataclasses import dataclass, field
+
+# Removes the GLSL functions that a shader does not use:
+# the source is split into top level functions and other code (declarations, structs, directives),
+# and only the functions reachable from the other code and main are kept, in their original order.
+
+FUNCTION_HEADER = re.compile(r"^\s*\w+\s+(\w+)\s*\([^;]*$")    # return type, name, arguments (not a prototype)
+IDENTIFIER = re.compile(r"\b[A-Za-z_]\w*\b")
+COMMENT = re.compile(r"//.*")
+
+
+@dataclass
+class Chunk:
+    name: str | None    # name of the function, None for code that is always kept
+    lines: list[str] = field(default_factory=list)
+    uses: set[str] = field(default_factory=set)     # identifiers in active code
+
+
+class Defines(dict):
+    # undefined macros are 0 in preprocessor conditions
+    def __missing__(self, key: str) -> int:
+        return 0
+
+def condition(expression: str, defines: Defines) -> bool:
+    # preprocessor condition with Python syntax for the operators, e.g. "COLORMAP == 1 && ARG_HUE"
+    expression = re.sub(r"defined\s*\(?\s*(\w+)\s*\)?", lambda match: str(int(match.group(1) in defines)), expression)
+    expression = expression.replace("&&", " and ").replace("||", " or ")
+    expression = re.sub(r"!(?!=)", " not ", expression)
+    return bool(eval(expression, {"__builtins__": {}}, defines))
+
+def split(source: str, defines: dict[str, int]) -> list[Chunk]:
+    defines = Defines(defines)
+    chunks = [Chunk(None)]
+    comments: list[str] = []    # comment lines right above a function belong to it
+    depth = 0
+    active = [True]     # one level per #if, False when the lines are skipped by the preprocessor
+    taken = [True]      # whether a branch of the #if was already active (for #elif and #else)
+
+    for line in source.splitlines(keepends=True):
+        stripped = line.strip()
+
+        if depth == 0:
+            header = FUNCTION_HEADER.match(line)
+            if header is not None and not stripped.startswith(("return", "else")):
+                chunks.append(Chunk(header.group(1), comments))
+                comments = []
+            elif chunks[-1].name is not None and not stripped.startswith("{"):
+                # end of the previous function
+                chunks.append(Chunk(None))
+
+            if stripped.startswith("//") and chunks[-1].name is None:
+                comments.append(line)
+                continue
+            chunks[-1].lines.extend(comments)
+            comments = []
+
+        # preprocessor conditions, only used to know which identifiers are used
+        directive = stripped.split(maxsplit=1)
+        if stripped.startswith("#") and directive[0] in ("#if", "#ifdef", "#ifndef", "#elif", "#else", "#endif"):
+            keyword, argument = directive[0], directive[1] if len(directive) > 1 else ""
+            if keyword in ("#if", "#ifdef", "#ifndef"):
+                value = {
+                    "#if": lambda: condition(argument, defines),
+                    "#ifdef": lambda: argument in defines,
+                    "#ifndef": lambda: argument not in defines,
+                }[keyword]()
+                active.append(active[-1] and value)
+                taken.append(value)
+            elif keyword == "#elif":
+                value = not taken[-1] and condition(argument, defines)
+                active[-1] = active[-2] and value
+                taken[-1] |= value
+            elif keyword == "#else":
+                active[-1] = active[-2] and not taken[-1]
+                taken[-1] = True
+            else:
+                active.pop()
+                taken.pop()
+            chunks[-1].lines.append(line)
+            continue
+
+        chunks[-1].lines.append(line)
+        code = COMMENT.sub("", line)
+        depth += code.count("{") - code.count("}")
+        if active[-1]:
+            chunks[-1].uses.update(IDENTIFIER.findall(code))
+
+    chunks[-1].lines.extend(comments)
+    return chunks
+
+def prune(source: str, defines: dict[str, int] | None = None) -> str:
+    # Source without the functions that are not called from main or from global code,
+    # defines are the macros added to the shader (code disabled by preprocessor conditions does not count as use).
+    chunks = split(source, defines or {})
+
+    functions: dict[str, list[Chunk]] = {}
+    for chunk in chunks:
+        if chunk.name is not None:
+            functions.setdefault(chunk.name, []).append(chunk)  # overloads share a name
+
+    used: set[str] = set()
+    to_visit = ["main"] + [name for chunk in chunks if chunk.name is None for name in chunk.uses]
+    while to_visit:
+        name = to_visit.pop()
+        if name in used or name not in functions:
+            continue
+        used.add(name)
+        for chunk in functions[name]:
+            to_visit.extend(chunk.uses - used)
+
+    return "".join(
+        "".join(chunk.lines)
+        for chunk in chunks
+        if chunk.name is None or chunk.name in used
+    )
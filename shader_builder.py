@@ -0,0 +1,220 @@
+from array import array
+from collections import OrderedDict
+from functools import cache
+
+import moderngl
+
+from expression_parser.bytecode import CODE_SIZE, CONSTANT_COUNT, Bytecode, interpreter_definitions
+from expression_parser import parameters, hoisting
+from shader_assembler import prune
+
+# Shader assembly shared by the Qt render widget and the headless renderer
+
+FRAGMENT_DIR = "fragment_shader/"
+FRAGMENT_FILES = ["header.glsl", "colormap.glsl", "complex.glsl", "shader.glsl"]
+INTERPRETER_FILES = ["header.glsl", "colormap.glsl", "complex.glsl", "interpreter.glsl", "shader.glsl"]
+OKHSL_TABLE_FILES = ["header.glsl", "colormap.glsl", "okhsl_table.glsl"]
+BLIT_FILE = "blit.glsl"
+
+# Ways of evaluating f in the fragment shader:
+# "glsl" compiles a shader specialized for each expression,
+# "bytecode" compiles a single interpreter shader and uploads the expression as bytecode in a buffer.
+ENGINES = {"glsl": "Specialized GLSL", "bytecode": "Bytecode interpreter"}
+
+# Uniform block of the interpreter (std140) : code length (ivec4), instructions, constants
+BYTECODE_BINDING = 0
+CONSTANTS_OFFSET = 16 + 4 * CODE_SIZE
+BYTECODE_BUFFER_SIZE = CONSTANTS_OFFSET + 8 * CONSTANT_COUNT
+
+PROGRAM_CACHE_SIZE = 16
+
+# Table of the okHSL colormap (hue, saturation, lightness), bound to the texture unit of okhsl_table in colormap.glsl
+OKHSL_TABLE_SIZE = (64, 32, 64)
+OKHSL_TABLE_UNIT = 1
+
+# Texture unit of the renders drawn by RenderTarget, binding of the image in blit.glsl
+BLIT_UNIT = 2
+
+QUAD_VERTICES = array('f', [
+    # position (x, y), uv coords (x, y)
+    -1.0, 1.0, -1.0, 1.0,   # topleft
+    1.0, 1.0, 1.0, 1.0,     # topright
+    -1.0, -1.0, -1.0, -1.0, # bottomleft
+    1.0, -1.0, 1.0, -1.0,   # bottomright
+])
+
+
+@cache
+def read_source(file_name: str) -> str:
+    # shader sources are only read once
+    with open(file_name) as f:
+        return f.read()
+
+def vertex_code() -> str:
+    return read_source("vertex_shader.glsl")
+
+def shader_defines(style: int, fast_math: bool = False) -> dict[str, int]:
+    # The style bitfield is fixed in the shader by macros instead of being read per pixel,
+    # a shader is assembled for each style and the disabled features are not compiled.
+    # fast_math selects the faster and less precise complex functions (see accuracy.py).
+    return {
+        "COLORMAP": style & 3,
+        "ARG_HUE": style >> 2 & 1,
+        "MOD_LUM": style >> 3 & 1,
+        "STYLE_LINES": style >> 4 & 15,
+        "FAST_MATH": int(fast_math),
+    }
+
+def assemble(file_names: list[str]) -> str:
+    code = "".join(read_source(FRAGMENT_DIR + file_name) for file_name in file_names)
+    return code.replace("DECLARATIONS", parameters.glsl_declarations() + hoisting.glsl_declarations())
+
+def finish(code: str, defines: dict[str, int]) -> str:
+    # adds the defines after the #version line and removes the functions that are not used
+    version, code = code.split("\n", 1)
+    lines = [version] + [f"#define {name} {value}" for name, value in defines.items()]
+    return prune("\n".join(lines) + "\n" + code, defines)
+
+def fragment_code(glsl_expression: str, definitions: str = "", defines: dict[str, int] | None = None) -> str:
+    # definitions are the GLSL functions called by the expression
+    code = assemble(FRAGMENT_FILES).replace("CUSTOM_FUNCTIONS", definitions)
+    return finish(code.replace("FUNCTION", glsl_expression), defines or shader_defines(0))
+
+@cache
+def interpreter_code(**defines: int) -> str:
+    # the same for every expression
+    code = assemble(INTERPRETER_FILES)
+    opcodes, cases = interpreter_definitions()
+    code = code.replace("DEFINITIONS", opcodes).replace("FUNCTION_CASES", cases).replace("CUSTOM_FUNCTIONS", "")
+    return finish(code.replace("FUNCTION", "return interpret(z, t);"), defines)
+
+def write_complex_array(program: moderngl.Program, name: str, values: list[complex]):
+    # values of a vec2 array uniform, like the parameters (in the order of PARAMS) or the hoisted values
+    if name in program:
+        uniform = program[name]
+        # the array is shortened by the compiler when the last values are not used, missing values are 0
+        values = (list(values) + [0j] * uniform.array_length)[:uniform.array_length]
+        uniform.write(array('f', [
+            part for value in values for part in (value.real, value.imag)
+        ]).tobytes())
+
+
+class ProgramCache:
+    # Linked programs and their vertex arrays, keyed by fragment shader source.
+    # The least recently used ones are released when there are more than `size`.
+
+    def __init__(self, ctx: moderngl.Context, quad_buffer: moderngl.Buffer, size: int = PROGRAM_CACHE_SIZE) -> None:
+        self.ctx = ctx
+        self.quad_buffer = quad_buffer
+        self.size = size
+        self.programs: OrderedDict[str, tuple[moderngl.Program, moderngl.VertexArray]] = OrderedDict()
+
+    def get(self, fragment_source: str) -> tuple[moderngl.Program, moderngl.VertexArray]:
+        # raises an Exception if the shader does not compile
+        if fragment_source in self.programs:
+            self.programs.move_to_end(fragment_source)
+            return self.programs[fragment_source]
+
+        program = self.ctx.program(vertex_shader=vertex_code(), fragment_shader=fragment_source)
+        render_object = self.ctx.vertex_array(
+            program, [(self.quad_buffer, '2f 2f', 'vert', 'texcoord')], skip_errors=True
+        )
+        self.programs[fragment_source] = (program, render_object)
+
+        while len(self.programs) > self.size:
+            _, (old_program, old_render_object) = self.programs.popitem(last=False)
+            old_render_object.release()
+            old_program.release()
+
+        return program, render_object
+
+    def release(self):
+        for program, render_object in self.programs.values():
+            render_object.release()
+            program.release()
+        self.programs.clear()
+
+
+class BytecodeBuffer:
+    # Uniform buffer holding the expression for the bytecode interpreter
+
+    def __init__(self, ctx: moderngl.Context) -> None:
+        self.buffer = ctx.buffer(reserve=BYTECODE_BUFFER_SIZE)
+
+    def write(self, bytecode: Bytecode):
+        # only the used part of the buffer is uploaded
+        self.buffer.write(bytecode.code_bytes())
+        if bytecode.constants:
+            self.buffer.write(bytecode.constant_bytes(), offset=CONSTANTS_OFFSET)
+
+    def use(self):
+        self.buffer.bind_to_uniform_block(BYTECODE_BINDING)
+
+    def release(self):
+        self.buffer.release()
+
+
+class OkhslTable:
+    # okhsl_to_srgba baked once per context in a 3D texture by a compute shader,
+    # sampled with linear filtering by the "OKHSL (fast)" colormap (COLORMAP 2).
+    # With the default size, rendered colors are at most ERROR levels (out of 255) from the exact colormap,
+    # the largest errors are in very dark colors where the sRGB transfer function is steep.
+    # Only a NaN lightness (style lines of overflowing values) differs: black when exact, undefined here.
+
+    ERROR = 2
+
+    def __init__(self, ctx: moderngl.Context, size: tuple[int, int, int] = OKHSL_TABLE_SIZE) -> None:
+        self.texture = ctx.texture3d(size, 4, dtype="f2")
+        self.texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+        self.texture.repeat_y = False
+        self.texture.repeat_z = False
+
+        # the table is computed with the exact colormap
+        baker = ctx.compute_shader(finish(assemble(OKHSL_TABLE_FILES), {"COLORMAP": 1}))
+        self.texture.bind_to_image(0, read=False, write=True)
+        baker.run(*(-(-n // 4) for n in size))
+        ctx.memory_barrier()
+        baker.release()
+
+    def use(self):
+        self.texture.use(OKHSL_TABLE_UNIT)
+
+    def release(self):
+        self.texture.release()
+
+
+class RenderTarget:
+    # Offscreen framebuffer for renders at another resolution than the screen,
+    # drawn on the current framebuffer with linear filtering (upscaled previews, downsampled supersampling).
+
+    def __init__(self, ctx: moderngl.Context, quad_buffer: moderngl.Buffer) -> None:
+        self.ctx = ctx
+        self.texture = None
+        self.framebuffer = None
+        self.program = ctx.program(vertex_shader=vertex_code(), fragment_shader=read_source(FRAGMENT_DIR + BLIT_FILE))
+        self.render_object = ctx.vertex_array(self.program, [(quad_buffer, '2f 2f', 'vert', 'texcoord')])
+
+    def use(self, size: tuple[int, int]):
+        # renders go to a framebuffer of the given size until another framebuffer is used
+        if self.texture is None or self.texture.size != size:
+            self.release_framebuffer()
+            self.texture = self.ctx.texture(size, 4)
+            self.texture.filter = (moderngl.LINEAR, moderngl.LINEAR)
+            self.texture.repeat_x = False
+            self.texture.repeat_y = False
+            self.framebuffer = self.ctx.framebuffer([self.texture])
+        self.framebuffer.use()
+
+    def draw(self):
+        self.texture.use(BLIT_UNIT)
+        self.render_object.render(mode=moderngl.TRIANGLE_STRIP)
+
+    def release_framebuffer(self):
+        if self.framebuffer is not None:
+            self.framebuffer.release()
+            self.texture.release()
+
+    def release(self):
+        self.release_framebuffer()
+        self.render_object.release()
+        self.program.release()
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+
+from PyQt5.QtGui import QImage, QPixmap
+from PyQt5.QtCore import QObject, QThread, QTimer, pyqtSignal, pyqtSlot
+
+from timings import startup
+
+PREVIEW_DELAY = 150         # ms without new request before rendering
+PREVIEW_CACHE_SIZE = 64     # rendered images kept in memory
+
+
+def to_pixmap(pixels) -> QPixmap:
+    # wraps the RGBA buffer without copy, pixels must stay alive until converted
+    height, width, _ = pixels.shape
+    image = QImage(pixels.data, width, height, 4 * width, QImage.Format_RGBA8888)
+    return QPixmap.fromImage(image)
+
+
+class TexWorker(QObject):
+    # Lives in the preview thread, renders one request at a time
+
+    done = pyqtSignal(int, str, int, object)
+    loaded = pyqtSignal()
+
+    def __init__(self, preview: "TexPreview") -> None:
+        super().__init__()
+        self.preview = preview
+
+    @pyqtSlot()
+    def load(self):
+        # matplotlib takes a while to import, it is only imported in this thread
+        with startup.phase("LaTeX renderer (background)"):
+            import tex_renderer
+        self.loaded.emit()
+
+    @pyqtSlot(int, str, int)
+    def render(self, request_id: int, latex: str, size: int):
+        if request_id != self.preview.last_request:
+            return  # a newer request was made since, this one is outdated
+
+        from tex_renderer import render_tex
+        try:
+            pixels = render_tex(latex, size=size)
+        except Exception:
+            return  # invalid LateX
+        self.done.emit(request_id, latex, size, pixels)
+
+
+class TexPreview(QObject):
+    # Renders LateX previews in a background thread:
+    # requests are debounced, outdated ones are dropped and results are kept in an LRU cache.
+
+    ready = pyqtSignal(QPixmap)
+    loaded = pyqtSignal()
+    load_requested = pyqtSignal()
+    requested = pyqtSignal(int, str, int)
+
+    def __init__(self, parent: QObject = None, delay: int = PREVIEW_DELAY, cache_size: int = PREVIEW_CACHE_SIZE) -> None:
+        super().__init__(parent)
+        self.cache_size = cache_size
+        self.cache: OrderedDict[tuple[str, int], QPixmap] = OrderedDict()
+        self.pending: tuple[str, int] = None
+        self.last_request = 0
+
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.start)
+
+        self.worker_thread = QThread()
+        self.worker = TexWorker(self)
+        self.worker.moveToThread(self.worker_thread)
+        self.load_requested.connect(self.worker.load)
+        self.worker.loaded.connect(self.loaded)
+        self.requested.connect(self.worker.render)
+        self.worker.done.connect(self.finish)
+        self.worker_thread.start()
+
+    def load(self):
+        # imports the renderer in the background ahead of the first request
+        self.load_requested.emit()
+
+    def request(self, latex: str, size: int):
+        self.pending = (latex, size)
+        self.timer.start()  # restarts the delay
+
+    def start(self):
+        self.last_request += 1
+        if self.pending in self.cache:
+            self.cache.move_to_end(self.pending)
+            self.ready.emit(self.cache[self.pending])
+            return
+        self.requested.emit(self.last_request, *self.pending)
+
+    def finish(self, request_id: int, latex: str, size: int, pixels):
+        # pixmaps can only be created in the GUI thread
+        pixmap = to_pixmap(pixels)
+        self.cache[(latex, size)] = pixmap
+        while len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        if request_id == self.last_request:
+            self.ready.emit(pixmap)
+
+    def stop(self):
+        self.last_request += 1  # drops queued requests
+        self.worker_thread.quit()
+        self.worker_thread.wait()
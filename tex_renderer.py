@@ -1,42 +1,35 @@
-from matplotlib import use
-import matplotlib.pyplot as plt
+from threading import Lock
 
+import numpy as np
 
-# activating an option to avoid segfault on some systems
+from matplotlib import rcParams
+from matplotlib.font_manager import FontProperties
+from matplotlib.mathtext import MathTextParser
 
-from subprocess import run, CalledProcessError
 
-SEGFAULT_PROCESS_RETURNCODE = -11
+# LaTeX is rasterized with Agg directly, pyplot and the GUI backends are not used (the backend does not matter)
 
-try:
-    run(["python3", "-m", "segfaulter.py"], check=True)
-except CalledProcessError as err:
-    if err.returncode == SEGFAULT_PROCESS_RETURNCODE:
-        use("tkagg")    # avoids Segfault on Fedora for some reason
+rcParams["mathtext.fontset"] = "cm" # Chooses a nice font for the rendered text
 
+DPI = 100       # pixels per inch, text size is given in points
+PADDING = 4     # blank pixels around the text
 
-# actual renderer
+# Lays out and rasterizes with Agg in one pass, without any figure (parsed expressions are cached by matplotlib)
+parser = MathTextParser("agg")
+# The pyparsing grammar and the cache of the parser are shared, the previews parse one at a time
+lock = Lock()
 
-plt.rcParams["mathtext.fontset"] = "cm" # Chooses a nice font for the rendered text
-fig = plt.figure()
-r = fig.canvas.get_renderer()
-
-def render_tex(expression: str, file_name: str, size: int = 12):
+def render_tex(expression: str, size: int = 12) -> np.ndarray:
     # expression is a string containing any text to allow mixed renders (text and LateX),
     # to render LateX make sure to put it in-between 2 `$` characters.
+    # Returns the render as contiguous RGBA rows (height, width, 4), black text on white,
+    # it can be wrapped without copy : QImage(pixels.data, width, height, 4 * width, QImage.Format_RGBA8888)
 
-    fig.clf()
-    plt.axis("off")
-
-    # change parameters here for centering and text size
-    text = fig.text(0.5, 0.5, f"{expression}", size=size, ha="center", va="center")
-
-    # Crops the render to fit text
-    bb = text.get_window_extent(renderer=r)
-    q = 110
-    fig.set_size_inches(bb.width/q, bb.height/q)
-
-    plt.draw()
+    with lock:
+        raster = parser.parse(expression, dpi=DPI, prop=FontProperties(size=size))
+    coverage = np.asarray(raster.image)
+    height, width = coverage.shape
 
-    plt.savefig(file_name, format="png", bbox_inches='tight', dpi=100)
-    # did not manage to save to BytesIO, Pillow wants a path
\ No newline at end of file
+    pixels = np.full((height + 2 * PADDING, width + 2 * PADDING, 4), 255, dtype=np.uint8)
+    pixels[PADDING:PADDING + height, PADDING:PADDING + width, :3] = (255 - coverage)[..., None]
+    return pixels
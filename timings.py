@@ -0,0 +1,48 @@
+from contextlib import contextmanager
+from threading import Lock
+from time import perf_counter
+
+# Timing reports, to track regressions in the time it takes for the windows to show up
+# or for an expression to be compiled
+
+
+class Timings:
+    # Named phases, in seconds since the creation of the object
+
+    def __init__(self, title: str = "Startup phase") -> None:
+        self.title = title
+        self.origin = perf_counter()
+        self.phases: list[tuple[str, float, float]] = []    # name, start, end
+        self.lock = Lock()  # phases can be recorded from worker threads
+
+    def now(self) -> float:
+        return perf_counter() - self.origin
+
+    def record(self, name: str, start: float, end: float):
+        with self.lock:
+            self.phases.append((name, start, end))
+
+    @contextmanager
+    def phase(self, name: str):
+        start = self.now()
+        try:
+            yield
+        finally:
+            self.record(name, start, self.now())
+
+    def mark(self, name: str):
+        # an event without duration, like the first frame being shown
+        now = self.now()
+        self.record(name, now, now)
+
+    def report(self) -> str:
+        lines = [f"{self.title:<32}{'start':>10}{'duration':>12}"]
+        with self.lock:
+            for name, start, end in sorted(self.phases, key=lambda phase: phase[1]):
+                duration = f"{(end - start) * 1000:10.1f}ms" if end > start else ""
+                lines.append(f"{name:<32}{start * 1000:8.1f}ms{duration}")
+        return "\n".join(lines)
+
+
+# Started when first imported, main imports it before anything else
+startup = Timings()